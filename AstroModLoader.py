@@ -1,37 +1,71 @@
 import os
 import sys
-import shutil
 import json
+import time
+import stat
+import socket
 import argparse
-import requests
 import traceback
 import logging
-from terminaltables import SingleTable
-import pprint
-import PySimpleGUI as sg
-
-from PyPAKParser import PakParser
-import cogs.AstroAPI as AstroAPI
-
-# force STA mode so that PySimpleGUI is happy
-import ctypes
-ctypes.windll.ole32.CoInitialize(None)
-import clr
-
-# deal with binary loading in .exe
-# pylint: disable=no-member
-# pylint: disable=import-error
-if hasattr(sys, "_MEIPASS"):
-    sys.path.append(os.path.join(sys._MEIPASS, "dlls"))
-else:
-    sys.path.append("dlls")
-    
-clr.AddReference("AstroModIntegrator")
-from AstroModIntegrator import ModIntegrator
+
+# heavy dependencies (PySimpleGUI, terminaltables, pythonnet, PyPAKParser) are imported on first use
+from cogs.MetadataCache import MetadataCache
+from cogs.ModReconciler import ModReconciler
+from cogs.ModIntegration import IntegrationCache, DotNetIntegrator, INTEGRATOR_PAK
+from cogs.FileLinker import FileLinker
+from cogs.IndexFetcher import IndexFetcher, createSession
+from cogs.HttpCache import HttpCache
+from cogs.GithubReleases import GITHUB_API, RELEASES_PER_PAGE, parseRepository, getReleasesUrl, getApiHeaders, getReleaseVersions
+from cogs.IndexFetcher import REQUEST_TIMEOUT
+from cogs.DownloadManager import DownloadManager, MAX_PARALLEL
+from cogs.MetadataScanner import readPakMetadata, scanMetadata, getDefaultJobs
+from cogs.Metrics import metrics
+from cogs.ModStore import ModStore
+from cogs.ModGC import VersionUsage, planEviction, DEFAULT_MAX_VERSIONS
+from cogs.VersionIndex import VersionList
+from cogs.FileWatcher import createWatcher, waitForChanges, ALL_FILES
+from cogs.Profiles import ProfileStore
+from cogs.ServerSync import buildManifest, checkManifestEntry, getManifestHash, SyncState, MANIFEST_VERSION
+from cogs.AtomicFile import writeFileAtomic
 
 MOD_LOADER_VERSION = "0.2.0"
+# seconds in which repeated modconfig.json changes are collected into one write
+CONFIG_WRITE_DELAY = 2
+GUI_FILTERS = ("All", "Active", "Inactive", "Updatable")
+# ms between checks for progress while mods are being installed
+GUI_POLL_INTERVAL = 100
+
+
+def loadGui():
+    # force STA mode so that PySimpleGUI is happy
+    import ctypes
+    ctypes.windll.ole32.CoInitialize(None)
+
+    import PySimpleGUI as sg
+    sg.theme('Default1')
+    return sg
+
+
+def runMirror(address, allowed, cachePath, maxAge, debugMode):
+    from cogs.Mirror import MirrorCache, MirrorServer
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.DEBUG if debugMode else logging.INFO)
+    if len(allowed) == 0:
+        logging.error("Pass the upstreams the mirror may fetch from with --mirror-allow")
+        return 2
+    host, _, port = address.rpartition(":")
+    # only reachable from other hosts when a host is given
+    server = MirrorServer(MirrorCache(cachePath, createSession(), maxAge), allowed, host or "127.0.0.1", int(port))
+    logging.info(f"Mirror listening on {host or '127.0.0.1'}:{port}, caching in {os.path.abspath(cachePath)}")
+    logging.info(f"Allowed upstreams: {', '.join(server.server.allowed)}")
+    server.serveForever()
+    return 0
+
+
 class AstroModLoader():
-    def __init__(self, gui, serverMode, updateOnly, debugMode):
+    def __init__(self, gui, serverMode, updateOnly, debugMode, rebuildCache=False, integratorBackend=DotNetIntegrator, jobs=None,
+            profile=False, metricsPath=None, modStorePath=None, gc=False, gcDryRun=False, batchCommands=None, watch=False, profileName=None,
+            syncServer=None, manifestPath=None):
         if debugMode or not hasattr(sys, "_MEIPASS"):
             logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.DEBUG)
         else:
@@ -39,12 +73,30 @@ class AstroModLoader():
 
         logging.info("AstroModLoader v" + MOD_LOADER_VERSION)
 
-        self.gui = gui
-        sg.theme('Default1')
+        # batch mode never asks anything
+        self.gui = gui and batchCommands is None
 
         self.serverMode = serverMode
         self.updateOnly = updateOnly
+        self.rebuildCache = rebuildCache
+        self.integratorBackend = integratorBackend
+        self.jobs = jobs if jobs is not None else getDefaultJobs()
+        self.profile = profile
+        self.metricsPath = metricsPath
+        self.modStorePath = modStorePath
+        self.gc = gc
+        self.gcDryRun = gcDryRun
+        self.batchCommands = batchCommands
+        self.watch = watch
+        self.profileName = profileName
+        self.syncServer = syncServer
+        self.manifestPath = manifestPath
         self.readonly = False
+        self.exitCode = 0
+        # called with short status texts while mods are installed, used by the GUI
+        self.progressCallback = None
+
+        metrics.enabled = self.profile or self.metricsPath is not None
 
         # configure and store used paths
         self.basePath = os.getenv('LOCALAPPDATA') if not self.serverMode else os.getcwd()
@@ -62,24 +114,65 @@ class AstroModLoader():
         self.installPath = os.path.join(self.installPath, "Paks")
 
         if not os.path.exists(os.path.join(self.downloadPath, "modconfig.json")):
-            with open(os.path.join(self.downloadPath, "modconfig.json"), 'w') as f:
-                f.write('{"mods":[]}')
+            writeFileAtomic(os.path.join(self.downloadPath, "modconfig.json"), '{"mods":[]}')
+        self.modConfigPending = None
+        self.modConfigWritten = 0
 
         self.gamePath = "" if not self.serverMode else os.getcwd()
 
+        # shared by all http requests so connections get reused, created on first use
+        self.session = None
+        # PlayFab client, keeps its session ticket between server lookups
+        self.astroAPI = None
+
         logging.debug(f"Mod download folder: {self.downloadPath}")
 
-        self.readModFiles()
+        try:
+            with metrics.span("readModFiles"):
+                self.readModFiles()
 
-        self.downloadUpdates()
+            with metrics.span("downloadUpdates"):
+                self.downloadUpdates()
 
-        self.setGamePath()
+            with metrics.span("setGamePath"):
+                self.setGamePath()
 
-        if not self.updateOnly:
-            if self.gui:
-                self.startGUI()
-            else:
-                self.startCli()
+            if self.gc or self.gcDryRun:
+                with metrics.span("collectGarbage"):
+                    self.collectGarbage(self.gcDryRun)
+
+            if self.profileName is not None:
+                if self.useProfile(self.profileName):
+                    self.updateReadonly()
+                    self.updateModInstallation()
+                    self.flushModConfig()
+                else:
+                    self.exitCode = 2
+
+            if self.syncServer is not None:
+                self.configureForServer(self.syncServer)
+                self.updateReadonly()
+                self.updateModInstallation()
+                self.flushModConfig()
+
+            if self.batchCommands is not None:
+                self.exitCode = self.runBatch(self.batchCommands)
+
+            # after the batch, so that the manifest lists the mods it configured
+            if self.manifestPath is not None and self.exitCode == 0:
+                self.writeManifest(self.manifestPath)
+
+            if self.batchCommands is None:
+                if self.watch:
+                    self.runWatch()
+                elif not self.updateOnly:
+                    if self.gui:
+                        self.startGUI()
+                    else:
+                        self.startCli()
+        finally:
+            self.flushModConfig()
+            self.reportMetrics()
 
         logging.info("Exiting...")
 
@@ -88,137 +181,311 @@ class AstroModLoader():
     # ------------------
 
     def readModFiles(self):
+        # don't lose a delayed write when reloading
+        self.flushModConfig()
         self.modConfig = {}
         with open(os.path.join(self.downloadPath, "modconfig.json"), 'r') as f:
-            self.modConfig = json.loads(f.read())
+            # kept to skip writes that wouldn't change anything
+            self.modConfigData = f.read()
+        self.modConfig = json.loads(self.modConfigData)
 
-        # gather mod list (only files)
-        modFilenames = set(self.getPaksInPath(
-            self.downloadPath) + self.getPaksInPath(self.installPath))
+        self.linker = FileLinker(self.modConfig.get("link_strategy", "auto"))
 
-        logging.info("Parsing metadata...")
-        self.mods = {}
-        for modFilename in modFilenames:
+        # gather mod list (only files), sorted so that the result doesn't depend on the listing order
+        modFilenames = sorted(set(self.getPaksInPath(
+            self.downloadPath) + self.getPaksInPath(self.installPath)))
+
+        self.metadataCache = MetadataCache(os.path.join(self.downloadPath, "metadatacache.json"),
+            verifyHash=self.modConfig.get("verify_cache_hash", False), rebuild=self.rebuildCache)
+
+        # optional store shared by several mod folders
+        # --mod-store is already absolute, a relative mod_store from modconfig.json is resolved from the base folder
+        storePath = self.modStorePath if self.modStorePath is not None else self.modConfig.get("mod_store")
+        self.modStore = ModStore(os.path.join(self.basePath, storePath)) if storePath else None
+        if self.modStore is not None:
+            self.modStore.addFolder(self.downloadPath)
+            self.modStore.addFolder(self.installPath)
 
-            # copy mods files only install dir to download dir
+        # copy mods files only install dir to download dir
+        for modFilename in modFilenames:
             if not os.path.isfile(os.path.join(self.downloadPath, modFilename)):
-                shutil.copyfile(os.path.join(
+                self.linker.link(os.path.join(
                     self.installPath, modFilename), os.path.join(self.downloadPath, modFilename))
 
-            # read metadata
-            metadata = self.getMetadata(os.path.join(
-                self.downloadPath, modFilename))
+        # read metadata, only the files that aren't cached are parsed
+        logging.info("Parsing metadata...")
+        metadata = {}
+        uncached = []
+        for modFilename in modFilenames:
+            path = os.path.join(self.downloadPath, modFilename)
+            metadata[modFilename] = self.metadataCache.getCachedMetadata(path)
+            if metadata[modFilename] is None and self.modStore is not None:
+                # another mod folder might have parsed the same pak already
+                sha = self.modStore.lookupHash(path)
+                if sha is not None and self.modStore.getMetadata(sha) is not None:
+                    metadata[modFilename] = self.modStore.getMetadata(sha)
+                    self.metadataCache.setMetadata(path, metadata[modFilename])
+                    self.metadataCache.setHash(path, sha)
+            if metadata[modFilename] is None:
+                uncached.append(path)
+
+        scanned = scanMetadata(uncached, self.jobs)
+        for path in scanned:
+            if scanned[path] is not None:
+                self.metadataCache.setMetadata(path, scanned[path])
+                metadata[os.path.basename(path)] = scanned[path]
+                if self.modStore is not None:
+                    self.modStore.setMetadata(self.metadataCache.getHash(path), scanned[path])
+
+        # merge in filename order so that parallel and serial scans give the same result
+        self.mods = {}
+        # mod_id -> VersionList, updated together with the versions of self.mods
+        self.versionIndex = {}
+        for modFilename in modFilenames:
+            if metadata[modFilename] is None:
+                continue
+            self.addModFile(modFilename, metadata[modFilename])
 
-            # get mod_id
-            mod_id = ""
-            if "mod_id" in metadata:
-                mod_id = metadata["mod_id"]
+        # fill missing installed
+        for mod_id in self.mods:
+            self.mods[mod_id].setdefault("installed", False)
+
+        if self.modStore is not None:
+            for mod_id in self.mods:
+                for version in self.mods[mod_id]["versions"]:
+                    self.addToStore(mod_id, version)
+            self.modStore.save()
+
+        self.metadataCache.prune(set(modFilenames))
+        self.metadataCache.save()
+
+        self.installCache = MetadataCache(os.path.join(self.downloadPath, "installcache.json"),
+            rebuild=self.rebuildCache)
+        self.reconciler = ModReconciler(self.installPath, self.metadataCache, self.installCache, self.linker)
+        self.integrationCache = IntegrationCache(os.path.join(self.downloadPath, "integration_cache"),
+            os.path.join(self.downloadPath, "temp_mods"), self.integratorBackend, self.linker)
+        self.versionUsage = VersionUsage(os.path.join(self.downloadPath, "versionusage.json"))
+        self.profiles = ProfileStore(os.path.join(self.downloadPath, "profiles.json"))
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            import pprint
+            logging.debug(pprint.pformat(self.mods))
+
+    def addModFile(self, modFilename, metadata):
+        # get mod_id
+        mod_id = ""
+        if "mod_id" in metadata:
+            mod_id = metadata["mod_id"]
+        else:
+            mod_id = modFilename.split("_")[0].split("-")[1]
+
+        # check if it's the first instance
+        if not mod_id in self.mods:
+            self.mods[mod_id] = {"mod_id": mod_id}
+
+        # field name, default
+        dataFields = (
+            ("name", modFilename),
+            ("author", "---"),
+            ("description", ""),
+            ("astro_build", "1.0.0.0"),
+            ("sync", "serverclient"),
+            ("homepage", ""),
+            ("download", {}),
+            ("linked_actor_components", {})
+        )
+        for dataField in dataFields:
+            if dataField[0] in metadata:
+                self.mods[mod_id][dataField[0]] = metadata[dataField[0]]
             else:
-                mod_id = modFilename.split("_")[0].split("-")[1]
-
-            # check if it's the first instance
-            if not mod_id in self.mods:
-                self.mods[mod_id] = {"mod_id": mod_id}
-
-            # field name, default
-            dataFields = (
-                ("name", modFilename),
-                ("author", "---"),
-                ("description", ""),
-                ("astro_build", "1.0.0.0"),
-                ("sync", "serverclient"),
-                ("homepage", ""),
-                ("download", {}),
-                ("linked_actor_components", {})
-            )
-            for dataField in dataFields:
-                if dataField[0] in metadata:
-                    self.mods[mod_id][dataField[0]] = metadata[dataField[0]]
-                else:
-                    self.mods[mod_id][dataField[0]] = dataField[1]
+                self.mods[mod_id][dataField[0]] = dataField[1]
 
-            # sync special case
-            if metadata == {}:
-                self.mods[mod_id]["sync"] = "client"
+        # sync special case
+        if metadata == {}:
+            self.mods[mod_id]["sync"] = "client"
 
-            # read priority
-            self.mods[mod_id]["priority"] = modFilename.split("_")[0].split("-")[0]
+        # read priority
+        self.mods[mod_id]["priority"] = modFilename.split("_")[0].split("-")[0]
 
-            # versions
-            version = ""
-            if "version" in metadata:
-                version = metadata["version"]
-            else:
-                version = self.getVersionFromFilename(modFilename)
+        # versions
+        version = ""
+        if "version" in metadata:
+            version = metadata["version"]
+        else:
+            version = self.getVersionFromFilename(modFilename)
 
-            if not "versions" in self.mods[mod_id]:
-                self.mods[mod_id]["versions"] = {}
+        if not "versions" in self.mods[mod_id]:
+            self.mods[mod_id]["versions"] = {}
 
-            self.mods[mod_id]["versions"][version] = { "filename": modFilename }
-            
-            # check if mod is installed
-            if os.path.isfile(os.path.join(self.installPath, modFilename)):
-                self.mods[mod_id]["installed"] = True   
-
-            # read data from modconfig.json
-            if mod_id in self.modConfig["mods"]:
-                self.mods[mod_id]["update"] = self.modConfig["mods"][mod_id]["update"]
-                if self.modConfig["mods"][mod_id]["version"] in self.mods[mod_id]["versions"]:
-                    self.mods[mod_id]["version"] = self.modConfig["mods"][mod_id]["version"]
-                else:
-                    if self.mods[mod_id]["download"] == {}:
-                        self.mods[mod_id]["version"] = self.getLatestVersion(mod_id)
-                    else:
-                        self.mods[mod_id]["version"] = "latest"
+        # keep data of a version that is also listed in an index file (when called after downloadUpdates)
+        self.mods[mod_id]["versions"].setdefault(version, {})["filename"] = modFilename
+        self.addVersion(mod_id, version)
+        
+        # check if mod is installed
+        if os.path.isfile(os.path.join(self.installPath, modFilename)):
+            self.mods[mod_id]["installed"] = True   
+
+        # read data from modconfig.json
+        if mod_id in self.modConfig["mods"]:
+            self.mods[mod_id]["update"] = self.modConfig["mods"][mod_id]["update"]
+            # once written, modconfig.json decides which mods are active, so they can be changed by editing it
+            if "installed" in self.modConfig["mods"][mod_id]:
+                self.mods[mod_id]["installed"] = self.modConfig["mods"][mod_id]["installed"]
+            if self.modConfig["mods"][mod_id]["version"] in self.mods[mod_id]["versions"]:
+                self.mods[mod_id]["version"] = self.modConfig["mods"][mod_id]["version"]
             else:
-                self.mods[mod_id]["update"] = self.mods[mod_id]["download"] != {}
                 if self.mods[mod_id]["download"] == {}:
                     self.mods[mod_id]["version"] = self.getLatestVersion(mod_id)
                 else:
                     self.mods[mod_id]["version"] = "latest"
-
-        # fill missing installed
+        else:
+            self.mods[mod_id]["update"] = self.mods[mod_id]["download"] != {}
+            if self.mods[mod_id]["download"] == {}:
+                self.mods[mod_id]["version"] = self.getLatestVersion(mod_id)
+            else:
+                self.mods[mod_id]["version"] = "latest"
+
+    def removeModFile(self, modFilename):
+        for mod_id in list(self.mods):
+            for version in list(self.mods[mod_id]["versions"]):
+                if self.mods[mod_id]["versions"][version].get("filename") != modFilename:
+                    continue
+                # versions from an index file can be downloaded again
+                if "download_url" in self.mods[mod_id]["versions"][version]:
+                    continue
+                del self.mods[mod_id]["versions"][version]
+                self.versionIndex[mod_id].remove(version)
+
+            if len(self.mods[mod_id]["versions"]) == 0:
+                del self.mods[mod_id]
+                del self.versionIndex[mod_id]
+            elif self.mods[mod_id]["version"] != "latest" and not self.mods[mod_id]["version"] in self.mods[mod_id]["versions"]:
+                self.mods[mod_id]["version"] = self.getLatestVersion(mod_id) if self.mods[mod_id]["download"] == {} else "latest"
+
+    def updateModFiles(self, modFilenames):
+        """Reads only the given files again after they were added, changed or removed."""
+        changed = []
+        for modFilename in modFilenames:
+            self.removeModFile(modFilename)
+            if os.path.isfile(os.path.join(self.downloadPath, modFilename)):
+                changed.append(modFilename)
+
+        metadata = {}
+        uncached = []
+        for modFilename in changed:
+            path = os.path.join(self.downloadPath, modFilename)
+            metadata[modFilename] = self.metadataCache.getCachedMetadata(path)
+            if metadata[modFilename] is None:
+                uncached.append(path)
+        scanned = scanMetadata(uncached, self.jobs)
+        for path in scanned:
+            if scanned[path] is not None:
+                self.metadataCache.setMetadata(path, scanned[path])
+                metadata[os.path.basename(path)] = scanned[path]
+
+        for modFilename in changed:
+            if metadata[modFilename] is not None:
+                self.addModFile(modFilename, metadata[modFilename])
         for mod_id in self.mods:
-            self.mods[mod_id]["installed"] = True if "installed" in self.mods[mod_id] else False
-        
-        logging.debug(pprint.pformat(self.mods))
+            if not "installed" in self.mods[mod_id]:
+                self.mods[mod_id]["installed"] = False
+
+        if self.modStore is not None:
+            for mod_id in self.mods:
+                for version in self.mods[mod_id]["versions"]:
+                    if self.mods[mod_id]["versions"][version]["filename"] in changed:
+                        self.addToStore(mod_id, version)
+            self.modStore.save()
+
+        self.metadataCache.prune(set(self.getPaksInPath(self.downloadPath)))
+        self.metadataCache.save()
 
     def downloadUpdates(self):
 
         logging.info("Checking for updates...")
+
+        # index file url -> mod_ids using it
+        indexMods = {}
+        # "owner/repo" -> mod_ids released there
+        repositoryMods = {}
         for mod_id in self.mods:
             if self.mods[mod_id]["download"] != {} and self.mods[mod_id]["update"]:
                 downloadData = self.mods[mod_id]["download"]
 
                 if downloadData["type"] == "github_repository":
                     logging.debug(f"{mod_id}: github repo")
-
-                    # TODO github updates
+                    repository = parseRepository(downloadData.get("url", ""))
+                    if repository is None:
+                        logging.warning(f"{mod_id}: incorrect github repository {downloadData.get('url')}")
+                        continue
+                    if not repository in repositoryMods:
+                        repositoryMods[repository] = []
+                    repositoryMods[repository].append(mod_id)
 
                 elif downloadData["type"] == "index_file":
                     logging.debug(f"{mod_id}: index file")
-
-                    try:
-                        r = requests.get(downloadData["url"])
-                        modData = r.json()["mods"][mod_id]
-
-                        # merge the local versions with the remote one
-                        for v in modData["versions"]:
-                            self.mods[mod_id]["versions"][v] = modData["versions"][v]
-                        
-                    except Exception:
-                        logging.error(f"An exception occured while updating {mod_id}")
-                        logging.debug(traceback.format_exc())
+                    if not downloadData["url"] in indexMods:
+                        indexMods[downloadData["url"]] = []
+                    indexMods[downloadData["url"]].append(mod_id)
                 else:
                     logging.warning(f"{mod_id}: incorrect download type")
             
             else:
                 logging.debug(f"{mod_id} no update info available or disabled")
 
+        # every index file is only fetched once, no matter how many mods use it
+        httpCache = HttpCache(os.path.join(self.downloadPath, "httpcache.json"), self.modConfig.get("index_max_age", 0))
+        urls = {url: self.rewriteUrl(url) for url in indexMods}
+        indexes = IndexFetcher(self.getSession(), httpCache).fetchAll(urls.values()) if len(indexMods) > 0 else {}
+        for url in indexMods:
+            for mod_id in indexMods[url]:
+                if indexes[urls[url]] is None:
+                    continue
+                try:
+                    modData = indexes[urls[url]]["mods"][mod_id]
+
+                    # merge the local versions with the remote one
+                    for v in modData["versions"]:
+                        self.mods[mod_id]["versions"][v] = modData["versions"][v]
+                        self.addVersion(mod_id, v)
+
+                except Exception:
+                    logging.error(f"An exception occured while updating {mod_id}")
+                    logging.debug(traceback.format_exc())
+
+        # the releases of a repository are listed once, an unchanged listing costs no api rate limit thanks to its ETag
+        apiUrl = self.modConfig.get("github_api_url", GITHUB_API)
+        releases = {}
+        if len(repositoryMods) > 0:
+            fetcher = IndexFetcher(self.getSession(), httpCache, headers=getApiHeaders(self.modConfig.get("github_token")))
+            # repository -> next page to fetch, all repositories are fetched together page by page
+            pages = {repository: 1 for repository in repositoryMods}
+            while len(pages) > 0:
+                pageUrls = {repository: self.rewriteUrl(getReleasesUrl(repository, apiUrl, pages[repository])) for repository in pages}
+                results = fetcher.fetchAll(pageUrls.values())
+                for repository in list(pages):
+                    page = results[pageUrls[repository]]
+                    if isinstance(page, list):
+                        releases.setdefault(repository, []).extend(page)
+                    if isinstance(page, list) and len(page) == RELEASES_PER_PAGE:
+                        pages[repository] += 1
+                    else:
+                        del pages[repository]
+        for repository in repositoryMods:
+            for mod_id in repositoryMods[repository]:
+                if not repository in releases:
+                    continue
+                versions = getReleaseVersions(releases[repository], mod_id)
+                if len(versions) == 0:
+                    logging.warning(f"{mod_id}: no release of {repository} has a matching pak")
+                for v in versions:
+                    self.mods[mod_id]["versions"][v] = versions[v]
+                    self.addVersion(mod_id, v)
+
     def updateReadonly(self):
         if not self.readonly:
             try:
-                targetPath = os.path.join(self.installPath, "999-AstroModIntegrator_P.pak")
+                targetPath = os.path.join(self.installPath, INTEGRATOR_PAK)
                 if not os.path.isfile(targetPath):
                     return
                 f = open(targetPath, "a")
@@ -227,80 +494,217 @@ class AstroModLoader():
                 self.readonly = True
 
     def updateModInstallation(self):
+        """Downloads, integrates and installs the active mods, returns False if the integration failed."""
         if self.readonly:
-            return
-
-        # clear install path
-        try:
-            for pak in self.getPaksInPath(self.installPath):
-                os.remove(os.path.join(self.installPath, pak))
-        except PermissionError:
-            self.readonly = True
-            return
-
-        # mod integration with some checks
-        if self.gamePath != "":
-            logging.debug("Doing mod integration")
+            return True
+
+        with metrics.span("updateModInstallation"):
+            # the integrator reads the downloaded paks, so they have to be there first
+            with metrics.span("download"):
+                self.downloadMods()
+
+            # mod integration with some checks
+            integrated = True
+            if self.gamePath != "":
+                self.reportProgress("Integrating mods...")
+                with metrics.span("integration"):
+                    integrated = self.integrateMods()
+
+            self.reportProgress("Installing mod files...")
+            with metrics.span("copy"):
+                self.installMods()
+            if self.readonly:
+                return integrated
 
-            # do mod integration
-            os.mkdir(os.path.join(self.downloadPath, "temp_mods"))
+            self.writeModConfig()
+            return integrated
 
-            try:
-                for mod_id in self.mods:
-                    version = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
-                    filename = self.mods[mod_id]["versions"][version]["filename"]
+    def getIntegrationInputs(self):
+        inputs = {}
+        inputHashes = {}
+        for mod_id in self.mods:
+            version = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+            filename = self.mods[mod_id]["versions"][version]["filename"]
 
-                    if self.mods[mod_id]["linked_actor_components"] != {} and (self.mods[mod_id]["installed"]):
-                        shutil.copyfile(os.path.join(self.downloadPath, filename), os.path.join(self.downloadPath, "temp_mods", filename))
+            if self.mods[mod_id]["linked_actor_components"] != {} and (self.mods[mod_id]["installed"]):
+                inputs[filename] = os.path.join(self.downloadPath, filename)
+                inputHashes[filename] = self.metadataCache.getHash(inputs[filename])
+        return inputs, inputHashes
 
-                ModIntegrator.IntegrateMods(os.path.join(self.downloadPath, "temp_mods"),
-                    os.path.join(self.gamePath, R"Astro\Content\Paks"))
+    def integrateMods(self):
+        try:
+            inputs, inputHashes = self.getIntegrationInputs()
+
+            # only runs the integrator if the inputs changed since a previous run
+            self.integrationCache.install(inputs, inputHashes, os.path.join(self.gamePath, R"Astro\Content\Paks"),
+                os.path.join(self.installPath, INTEGRATOR_PAK), self.installCache.getHash)
+            return True
+        except Exception:
+            logging.error("Something went wrong during integration!")
+            traceback.print_exc()
+            return False
+
+    def downloadMods(self):
+        # DOWNLOAD mod files that are not locally available
+        downloads = {}
+        for mod_id in self.mods:
+            version = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+            versionData = self.mods[mod_id]["versions"][version]
+            targetPath = os.path.join(self.downloadPath, versionData["filename"])
 
-                shutil.copyfile(os.path.join(self.downloadPath, "temp_mods", "999-AstroModIntegrator_P.pak"),
-                    os.path.join(self.installPath, "999-AstroModIntegrator_P.pak"))
-            except Exception:
-                logging.error("Something went wrong during integration!")
-                traceback.print_exc()
-            
-            shutil.rmtree(os.path.join(self.downloadPath, "temp_mods"))
+            if self.mods[mod_id]["installed"] and "download_url" in versionData:
+                if not os.path.isfile(targetPath) or ("size" in versionData and os.path.getsize(targetPath) != versionData["size"]):
+                    # another mod folder sharing the store might have downloaded it already
+                    blobPath = self.modStore.find(mod_id, version) if self.modStore is not None else None
+                    if blobPath is not None:
+                        logging.info(f"Linking {mod_id} {version} from the mod store")
+                        self.linker.link(blobPath, targetPath)
+                        continue
 
-        # load all previously active mods back into mod path (with changes)
+                    logging.info(f"Downloading {mod_id} {version} ...")
+                    self.reportProgress(f"Downloading {mod_id} {version}...")
+                    downloads[mod_id] = (self.rewriteUrl(versionData["download_url"]), targetPath, versionData.get("sha256"), versionData.get("size"),
+                        self.findPatch(mod_id, versionData))
+        if len(downloads) > 0:
+            failed = DownloadManager(self.getSession(), self.modConfig.get("max_parallel_downloads", MAX_PARALLEL)).downloadAll(downloads)
+
+            if self.modStore is not None:
+                for mod_id in downloads:
+                    if not mod_id in failed:
+                        version = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+                        self.addToStore(mod_id, version)
+                self.modStore.save()
+
+    def findPatch(self, mod_id, versionData):
+        """Returns the smallest patch in versionData that applies to a version available locally, or None."""
+        best = None
+        for baseVersion in versionData.get("patches", {}):
+            patch = versionData["patches"][baseVersion]
+            if not baseVersion in self.mods[mod_id]["versions"] or not "url" in patch:
+                continue
+            basePath = os.path.join(self.downloadPath, self.mods[mod_id]["versions"][baseVersion]["filename"])
+            if os.path.isfile(basePath) and (best is None or patch.get("size", 0) < best.get("size", 0)):
+                best = {**patch, "url": self.rewriteUrl(patch["url"]), "base": basePath}
+        return best
+
+    def installMods(self):
+        # collect the desired state of the install path
+        desired = {}
         for mod_id in self.mods:
             version = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
             versionData = self.mods[mod_id]["versions"][version]
             
             if self.mods[mod_id]["installed"]:
-                # --------
-                # DOWNLOAD mod file if not locally available
-                if not os.path.isfile(os.path.join(self.downloadPath, versionData["filename"])):
-                    logging.info(f"Downloading {mod_id} {version} ...")
+                sourcePath = os.path.join(self.downloadPath, versionData["filename"])
+                if os.path.isfile(sourcePath):
+                    desired[versionData["filename"]] = sourcePath
+                else:
+                    logging.error(f"{mod_id} {version} is not available locally and can't be installed")
 
-                    try:
-                        r = requests.get(versionData["download_url"], stream=True)
-                        with open(os.path.join(self.downloadPath, versionData["filename"]), "wb") as f:
-                            r.raw.decode_content = True
-                            shutil.copyfileobj(r.raw, f)
-                    except Exception:
-                        logging.error(f"An exception occured while downloading {mod_id}")
-                        logging.debug(traceback.format_exc())
+        # only add, remove or replace the paks that differ
+        try:
+            self.reconciler.reconcile(desired, self.getPaksInPath(self.installPath), keep=[INTEGRATOR_PAK])
+        except PermissionError:
+            self.readonly = True
+            return
 
-                    logging.debug("download finished")
+        # last use times decide which old versions get collected first
+        self.versionUsage.markUsed(desired.keys())
+        self.versionUsage.save()
 
-                # copy from \Mods to \Paks
-                shutil.copyfile(os.path.join(
-                    self.downloadPath, versionData["filename"]), os.path.join(self.installPath, versionData["filename"]))
+    def collectGarbage(self, dryRun=False):
+        maxSize = self.modConfig.get("gc_max_size_mb")
+        maxSize = maxSize * 1024 * 1024 if maxSize is not None else None
+        maxVersions = self.modConfig.get("gc_max_versions", DEFAULT_MAX_VERSIONS)
 
-        # write modconfig.json
+        # the selected and the currently installed versions are never deleted
+        installed = set(self.getPaksInPath(self.installPath))
+        candidates = []
+        for mod_id in self.mods:
+            selected = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+            for version in self.mods[mod_id]["versions"]:
+                filename = self.mods[mod_id]["versions"][version]["filename"]
+                path = os.path.join(self.downloadPath, filename)
+                if not os.path.isfile(path):
+                    continue
+                candidates.append({
+                    "mod_id": mod_id,
+                    "version": version,
+                    "filename": filename,
+                    "size": os.path.getsize(path),
+                    "last_used": self.versionUsage.getLastUsed(path),
+                    "active": version == selected or filename in installed
+                })
+
+        evicted = planEviction(candidates, maxSize, maxVersions)
+        for e in evicted:
+            logging.info(f"{'Would remove' if dryRun else 'Removing'} {e['mod_id']} {e['version']} ({e['size'] / 1024 / 1024:.2f} MiB)")
+        # files linked to a mod store blob only free their space once the blob goes as well
+        freed = sum(e["size"] for e in evicted if self.isLastCopy(os.path.join(self.downloadPath, e["filename"]), includeBlob=dryRun))
+        if dryRun:
+            if self.modStore is not None:
+                freed += self.modStore.collectGarbage(dryRun=True)[1]
+            logging.info(f"Would free {freed / 1024 / 1024:.2f} MiB by removing {len(evicted)} old versions")
+            return evicted
+
+        for e in evicted:
+            os.remove(os.path.join(self.downloadPath, e["filename"]))
+            # versions from an index can be downloaded again, local only ones are gone
+            if not "download_url" in self.mods[e["mod_id"]]["versions"][e["version"]]:
+                del self.mods[e["mod_id"]]["versions"][e["version"]]
+                self.versionIndex[e["mod_id"]].remove(e["version"])
+
+        if len(evicted) > 0:
+            remaining = set(self.getPaksInPath(self.downloadPath))
+            self.versionUsage.prune(remaining)
+            self.versionUsage.save()
+            self.metadataCache.prune(remaining)
+            self.metadataCache.save()
+            self.writeModConfig()
+        if self.modStore is not None:
+            freed += self.modStore.collectGarbage()[1]
+            self.modStore.save()
+        logging.info(f"Freed {freed / 1024 / 1024:.2f} MiB by removing {len(evicted)} old versions")
+        return evicted
+
+    def isLastCopy(self, path, includeBlob=False):
+        """True if removing path frees its space. With includeBlob, a file only linked to its mod store blob counts as well."""
+        info = os.lstat(path)
+        if stat.S_ISLNK(info.st_mode):
+            return False
+        if info.st_nlink == 1:
+            return True
+        if includeBlob and self.modStore is not None and info.st_nlink == 2:
+            sha = self.modStore.lookupHash(path)
+            blobPath = self.modStore.getBlobPath(sha) if sha is not None else None
+            return blobPath is not None and os.path.isfile(blobPath) and os.path.samefile(path, blobPath)
+        return False
+
+    def writeModConfig(self, force=False):
         config = {}
         for mod_id in self.mods:
             config[mod_id] = {
+                "installed": self.mods[mod_id]["installed"],
                 "update": self.mods[mod_id]["update"],
                 "version": self.mods[mod_id]["version"]
             }
-        with open(os.path.join(self.downloadPath, "modconfig.json"), 'r+') as f:
-            f.truncate(0)
-        with open(os.path.join(self.downloadPath, "modconfig.json"), 'w') as f:
-            f.write(json.dumps({"mods": config, "game_path": self.gamePath}, indent=4))
+        data = json.dumps({**self.modConfig, "mods": config, "game_path": self.gamePath}, indent=4)
+        if data == self.modConfigData:
+            self.modConfigPending = None
+            return
+
+        # quick successive changes (e.g. clicking through the GUI) are written once
+        self.modConfigPending = data
+        if force or time.time() - self.modConfigWritten >= CONFIG_WRITE_DELAY:
+            self.flushModConfig()
+
+    def flushModConfig(self):
+        if self.modConfigPending is None:
+            return
+        writeFileAtomic(os.path.join(self.downloadPath, "modconfig.json"), self.modConfigPending)
+        self.modConfigData = self.modConfigPending
+        self.modConfigPending = None
+        self.modConfigWritten = time.time()
 
     # --------------------
     #! INTERFACE FUNCTIONS
@@ -324,14 +728,20 @@ class AstroModLoader():
                 print("Usage: server [IP:Port]")
             elif full_args[0] == "list":
                 print("Usage: list")
+            elif full_args[0] == "gc":
+                print("Usage: gc [dry]")
+            elif full_args[0] == "profile":
+                print("Usage: profile [list/save/use/delete] [name]")
             elif full_args[0] == "help":
                 print("Usage: help [command]")
             else:
                 print("Unknown command")
         else:
-            print("Commands: exit, enable, disable, version, update, info, (server,) list, help")
+            print("Commands: exit, enable, disable, version, update, info, (server,) list, gc, profile, help")
 
     def startCli(self):
+        from terminaltables import SingleTable
+
         self.printModList = True
         self.updateReadonly()
         while True:
@@ -441,134 +851,409 @@ class AstroModLoader():
                     else:
                         IP = input("server IP:Port? ")
                     
-                    self.configureForServer(IP)
+                    if self.configureForServer(IP):
+                        self.printModList = True
             elif cmd == "list":
                 self.printModList = True
+            elif cmd == "gc":
+                dryRun = len(full_args) > 0 and full_args[0] == "dry"
+                if self.readonly and not dryRun:
+                    print("You cannot modify mods in readonly mode.")
+                else:
+                    self.collectGarbage(dryRun)
+                    self.printModList = True
+            elif cmd == "profile":
+                action = full_args[0] if len(full_args) > 0 else "list"
+                name = full_args[1] if len(full_args) > 1 else None
+                if action == "list":
+                    print(f"Profiles: {', '.join(self.profiles.names()) or '---'}")
+                elif name is None:
+                    self.displayHelp(["profile"])
+                elif action == "save":
+                    self.saveProfile(name)
+                    print(f"Saved profile {name}")
+                elif action == "delete":
+                    if not self.deleteProfile(name):
+                        print("There is no profile with that name")
+                elif action == "use":
+                    if self.readonly:
+                        print("You cannot modify mods in readonly mode.")
+                    elif self.useProfile(name):
+                        self.printModList = True
+                else:
+                    self.displayHelp(["profile"])
             elif cmd == "help":
                 self.displayHelp(full_args)
             else:
                 print("Unknown command, use help for help")
 
-    def startGUI(self):
-        logging.info("gui go brrrrrrrr")
+    def saveProfile(self, name):
+        mods = {}
+        for mod_id in self.mods:
+            # pin "latest" to the current version, the integration below is pinned to it as well
+            version = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+            mods[mod_id] = {"installed": self.mods[mod_id]["installed"], "version": version}
+        self.profiles.set(name, mods)
 
-        # create header
-        layout = [
-            [sg.Text("Available Mods:")],
-            [
-                sg.Text("Active", size=(4, 1)),
-                sg.Text("Modname", size=(25, 1)),
-                sg.Text("Version", size=(15, 1)),
-                sg.Text("Author", size=(15, 1)),
-                sg.Text("Sync", size=(10, 1)),
-                sg.Text("Download updates?", size=(15, 1))
-            ]
-        ]
+        if self.gamePath != "":
+            # integrate now and keep the result, so that switching to the profile never runs the integrator
+            try:
+                inputs, inputHashes = self.getIntegrationInputs()
+                gamePaksPath = os.path.join(self.gamePath, R"Astro\Content\Paks")
+                self.integrationCache.getResult(inputs, inputHashes, gamePaksPath)
+                self.integrationCache.pin(f"profile:{name}", self.integrationCache.getFingerprint(inputHashes, gamePaksPath))
+            except Exception:
+                logging.error(f"Failed to prepare the mod integration for profile {name}")
+                logging.debug(traceback.format_exc())
 
-        checkboxes = []
+    def useProfile(self, name):
+        profile = self.profiles.get(name)
+        if profile is None:
+            logging.error(f"There is no profile called {name}")
+            return False
 
-        # create table
         for mod_id in self.mods:
-            cbA = sg.Checkbox("   ", default=self.mods[mod_id]["installed"], enable_events=True, key=f"install_{mod_id}")
-            cbB = sg.Checkbox("", default=self.mods[mod_id]["update"], enable_events=True, key=f"update_{mod_id}", disabled=self.mods[mod_id]["download"] == {})
+            data = profile["mods"].get(mod_id)
+            if data is None:
+                self.mods[mod_id]["installed"] = False
+                continue
+
+            self.mods[mod_id]["installed"] = data["installed"]
+            if data["version"] in self.mods[mod_id]["versions"] or (data["version"] == "latest" and self.mods[mod_id]["download"] != {}):
+                self.mods[mod_id]["version"] = data["version"]
+            else:
+                logging.warning(f"{mod_id} {data['version']} is not available, keeping {self.mods[mod_id]['version']}")
+
+        missing = [mod_id for mod_id in profile["mods"] if not mod_id in self.mods and profile["mods"][mod_id]["installed"]]
+        if len(missing) > 0:
+            logging.warning(f"Profile {name} uses mods that are not available: {', '.join(missing)}")
+        logging.info(f"Using profile {name}")
+        return True
+
+    def deleteProfile(self, name):
+        if self.profiles.delete(name):
+            self.integrationCache.unpin(f"profile:{name}")
+            return True
+        return False
+
+    def parseBatchCommand(self, full_args):
+        """Returns (mod_id, field, value) for one batch command or raises ValueError."""
+        cmd = full_args.pop(0)
+        if not cmd in ("enable", "activate", "disable", "deactivate", "version", "update"):
+            raise ValueError(f"unknown command {cmd}")
+        if len(full_args) == 0 or not full_args[0] in self.mods:
+            raise ValueError("no mod with that ID")
+        mod_id = full_args[0]
+
+        if cmd in ("enable", "activate"):
+            return mod_id, "installed", True
+        elif cmd in ("disable", "deactivate"):
+            return mod_id, "installed", False
+        elif cmd == "version":
+            versions = [*(["latest"] if self.mods[mod_id]["download"] != {} else []), *self.mods[mod_id]["versions"].keys()]
+            if len(full_args) < 2 or not full_args[1] in versions:
+                raise ValueError(f"version must be one of {versions}")
+            return mod_id, "version", full_args[1]
+        else:
+            if self.mods[mod_id]["download"] == {}:
+                raise ValueError("this mod has no download data")
+            if len(full_args) < 2 or not full_args[1].lower() in ("y", "n", "true", "false"):
+                raise ValueError("expected y/n")
+            return mod_id, "update", full_args[1].lower() in ("y", "true")
+
+    def runBatch(self, lines):
+        """Applies all commands at once with a single reconcile, returns the exit code.
+
+        Nothing is applied if one of the commands is invalid. A json summary is printed to stdout.
+        """
+        summary = {"ok": False, "changes": [], "errors": []}
+        changes = []
+        for number, line in enumerate(lines, 1):
+            full_args = line.split()
+            if len(full_args) == 0 or full_args[0].startswith("#"):
+                continue
+            try:
+                changes.append(self.parseBatchCommand(full_args))
+            except ValueError as err:
+                summary["errors"].append({"line": number, "command": line.strip(), "error": str(err)})
 
-            if not "---" in self.mods[mod_id]["versions"]:
-                
-                if self.mods[mod_id]["download"] != {}:
-                    defaultText = f"Latest ({self.getLatestVersion(mod_id)})"
-                    versions = [defaultText]
-                else:
-                    versions = []
-                    defaultText = ""
-                for v in self.sortVersions(list(self.mods[mod_id]["versions"].keys()))[::-1]:
-                    versions.append(v)
-                if defaultText == "":
-                    defaultText = versions[0]
-
-                versionDrop = sg.Combo(versions, default_value=defaultText if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"],
-                    enable_events=True, key=f"version_{mod_id}", size=(15, 1))
+        self.updateReadonly()
+        if self.readonly:
+            summary["errors"].append({"line": None, "command": None, "error": "the mod folder is readonly"})
+
+        exitCode = 2
+        if len(summary["errors"]) == 0:
+            for mod_id, field, value in changes:
+                if self.mods[mod_id][field] != value:
+                    summary["changes"].append({"mod_id": mod_id, "field": field, "old": self.mods[mod_id][field], "new": value})
+                    self.mods[mod_id][field] = value
+
+            integrated = self.updateModInstallation()
+            self.flushModConfig()
+            if self.readonly:
+                summary["errors"].append({"line": None, "command": None, "error": "failed to install the mod files"})
+                exitCode = 1
+            elif not integrated:
+                summary["errors"].append({"line": None, "command": None, "error": "failed to integrate the mods"})
+                exitCode = 1
             else:
-                versionDrop = sg.Combo([""], size=(15, 1), disabled=True)
-
-            layout.append([
-                cbA,
-                sg.Text(self.mods[mod_id]["name"], enable_events=True, key=f"info_{mod_id}", size=(25, 1)),
-                versionDrop,
-                sg.Text(self.mods[mod_id]["author"], size=(15, 1)),
-                sg.Text(self.mods[mod_id]["sync"], size=(10, 1)),
-                cbB
-            ])
-            checkboxes.append([mod_id, cbA, cbB])
+                summary["ok"] = True
+                exitCode = 0
 
-        # create footer
-        layout.append([
-            sg.Text("Loaded mods.", size=(40, 1), key="-message-")
-        ])
-        layout.append([sg.Exit(), sg.Button("Configure for server", key="server_config")])
+        print(json.dumps(summary, indent=4))
+        return exitCode
 
-        window = sg.Window("AstroModLoader v" + MOD_LOADER_VERSION, layout)
-        window.finalize()
+    def runWatch(self):
+        watcher = createWatcher(self.downloadPath)
+        logging.info(f"Watching {self.downloadPath} for changes ({watcher.name})")
+        try:
+            while True:
+                self.updateReadonly()
+                self.updateModInstallation()
+                self.flushModConfig()
+
+                # wait until something else than the loader itself changed the mods
+                while True:
+                    changes = waitForChanges(watcher)
+                    if changes is ALL_FILES or self.isModConfigChanged(changes):
+                        logging.info("Reloading all mods")
+                        self.readModFiles()
+                        self.downloadUpdates()
+                        break
+                    paks = [f for f in changes if os.path.splitext(f)[1] == ".pak" and f != INTEGRATOR_PAK]
+                    if len(paks) > 0:
+                        logging.info(f"Reading {len(paks)} changed mod files")
+                        self.updateModFiles(paks)
+                        break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    def isModConfigChanged(self, changes):
+        if not "modconfig.json" in changes:
+            return False
+        try:
+            with open(os.path.join(self.downloadPath, "modconfig.json"), 'r') as f:
+                return f.read() != self.modConfigData
+        except IOError:
+            return False
+
+    def startGUI(self):
+        logging.info("gui go brrrrrrrr")
+        sg = loadGui()
+
+        import queue
+        import threading
+
+        layout = [
+            [
+                sg.Text("Search:"),
+                sg.Input(key="-search-", enable_events=True, size=(30, 1)),
+                sg.Combo(GUI_FILTERS, default_value=GUI_FILTERS[0], key="-filter-", enable_events=True, readonly=True, size=(10, 1))
+            ],
+            # a single table scales to large libraries, only the visible rows are drawn
+            [sg.Table([], headings=["Active", "Modname", "Version", "Author", "Sync", "Updates"], key="-table-",
+                col_widths=[6, 30, 18, 15, 10, 8], auto_size_columns=False, justification="left", num_rows=20,
+                select_mode=sg.TABLE_SELECT_MODE_EXTENDED)],
+            [
+                sg.Button("Enable", key="-enable-"),
+                sg.Button("Disable", key="-disable-"),
+                sg.Button("Toggle updates", key="-update-"),
+                sg.Button("Version", key="-version-"),
+                sg.Button("Info", key="-info-")
+            ],
+            [sg.Text("Loaded mods.", size=(60, 1), key="-message-")],
+            [sg.Exit(), sg.Button("Configure for server", key="server_config")]
+        ]
+
+        window = sg.Window("AstroModLoader v" + MOD_LOADER_VERSION, layout, finalize=True)
+        visibleMods = self.updateModTable(window)
+
+        # installs run on a worker thread that reports back through a queue, the window polls it while busy
+        events = queue.Queue()
+        wakeup = threading.Event()
+        stopping = threading.Event()
+        passes = {"requested": 1, "done": 0}
+        self.progressCallback = lambda text: events.put(("progress", text))
+
+        def worker():
+            # passes["done"] is only updated by the window, so the worker counts its own passes
+            finished = 0
+            while True:
+                wakeup.wait()
+                wakeup.clear()
+                target = passes["requested"]
+                if target > finished:
+                    try:
+                        # syncing with a server downloads, so it runs here as well
+                        server = passes.pop("server", None)
+                        if server is not None:
+                            self.configureForServer(server)
+                        self.updateModInstallation()
+                    except Exception:
+                        logging.error("Something went wrong while installing mods!")
+                        logging.debug(traceback.format_exc())
+                    finished = target
+                    events.put(("done", target))
+                if stopping.is_set():
+                    # a change made while the last pass ran still has to be applied before exiting
+                    if finished >= passes["requested"]:
+                        return
+                    wakeup.set()
 
-        # Create the event loop
         self.updateReadonly()
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        wakeup.set()
+
         while True:
-            self.updateModInstallation()
-            if self.readonly:
-                for cb in checkboxes:
-                    cb[1].Update(value=self.mods[cb[0]]["installed"], disabled=True)
-                    cb[2].Update(value=self.mods[cb[0]]["update"], disabled=True)
-                checkboxes = [] # a restart of the loader is required to undo readonly mode
-            event, values = window.read()
-            
+            busy = passes["done"] < passes["requested"]
+            if busy:
+                timeout = GUI_POLL_INTERVAL
+            else:
+                # wake up to write a delayed modconfig.json change
+                timeout = CONFIG_WRITE_DELAY * 1000 if self.modConfigPending is not None else None
+            event, values = window.read(timeout=timeout)
             if event in (None, "Exit"):
                 break
 
-            # listen for checkboxes
-            self.updateReadonly()
-            if not self.readonly:
-                if event.startswith("install_"):
-                    changing_mod = event.split("_")[1]
-                    self.mods[changing_mod]["installed"] = values[event]
-                    
-                    window["-message-"].update(
-                        (f"Enabled" if values[event] else "Disabled") +
-                        f" {changing_mod}")
-                elif event.startswith("update_"):
-                    changing_mod = event.split("_")[1]
-                    self.mods[changing_mod]["update"] = values[event]
-
-                    window["-message-"].update(
-                        (f"Enabled updating of" if values[event] else "Disabled updating of") +
-                        f" {changing_mod}")
-
-                elif event.startswith("version_"):
-                    changing_mod = event.split("_")[1]
-                    self.mods[changing_mod]["version"] = values[event] if not values[event].startswith("Latest") else "latest"
-
-                    window["-message-"].update(f"Set version of {changing_mod} to {self.mods[changing_mod]['version']}")
-
-                elif event.startswith("info_"):
-                    mod_id = event.split("_")[1]
-                    m = self.mods[mod_id]
-                    popupText = f"Mod info for {m['name']}\n\n\n"
-                    popupText += f"Mod ID: {mod_id}\n\n"
-                    popupText += f"Author: {m['author']}\n\n"
-                    popupText += f"Astro Build: {m['astro_build']}\n\n"
-                    popupText += f"Sync: {m['sync']}\n\n"
-                    popupText += f"Homepage: {m['homepage']}\n\n"
-                    popupText += f"Description: \n{m['description']}\n\n"
-                    popupText += f"Versions: \n{json.dumps(m['versions'], indent=2)}\n\n"
-                    popupText += f"Download Data: \n{json.dumps(m['download'], indent=2)}"
-                    sg.Popup(popupText, title="Mod Info")
-
-                elif event == "server_config":
-                    self.configureForServer(sg.PopupGetText("Enter server IP:Port"))
-                
-                else:
-                    logging.debug(f'Event: {event}')
-                    logging.debug(str(values))
+            while not events.empty():
+                kind, data = events.get_nowait()
+                if kind == "progress":
+                    window["-message-"].update(data)
+                elif kind == "done":
+                    passes["done"] = data
+                    if passes["done"] >= passes["requested"]:
+                        self.updateReadonly()
+                        window["-message-"].update("Read only mode, restart the loader to change mods." if self.readonly else "Mods are up to date.")
+                        for key in ("-enable-", "-disable-", "-update-", "-version-", "server_config"):
+                            window[key].update(disabled=self.readonly)
+                        for key in ("-search-", "-filter-", "-info-"):
+                            window[key].update(disabled=False)
+                        visibleMods = self.updateModTable(window, values)
+
+            if event == sg.TIMEOUT_KEY:
+                if passes["done"] >= passes["requested"]:
+                    self.flushModConfig()
+                continue
+
+            # a server sync adds and removes mods on the worker, the table and the selection wait until it's done
+            if passes["done"] < passes.get("syncPass", 0):
+                continue
+
+            selected = [visibleMods[row] for row in values["-table-"] if row < len(visibleMods)]
+            changed = False
+            if event in ("-search-", "-filter-"):
+                visibleMods = self.updateModTable(window, values)
+            elif event == "-info-":
+                for mod_id in selected[:1]:
+                    self.showModInfo(sg, mod_id)
+            elif self.readonly:
+                pass
+            elif event in ("-enable-", "-disable-") and len(selected) > 0:
+                for mod_id in selected:
+                    self.mods[mod_id]["installed"] = event == "-enable-"
+                window["-message-"].update(("Enabled " if event == "-enable-" else "Disabled ") + ", ".join(selected))
+                changed = True
+            elif event == "-update-" and len(selected) > 0:
+                for mod_id in selected:
+                    if self.mods[mod_id]["download"] != {}:
+                        self.mods[mod_id]["update"] = not self.mods[mod_id]["update"]
+                window["-message-"].update(f"Changed updating of {', '.join(selected)}")
+                changed = True
+            elif event == "-version-" and len(selected) > 0:
+                version = self.chooseVersion(sg, selected[0])
+                if version is not None:
+                    self.mods[selected[0]]["version"] = version
+                    window["-message-"].update(f"Set version of {selected[0]} to {version}")
+                    changed = True
+            elif event == "server_config":
+                server = sg.PopupGetText("Enter server IP:Port")
+                if server:
+                    window["-message-"].update(f"Getting the mods of {server}...")
+                    for key in ("-enable-", "-disable-", "-update-", "-version-", "server_config", "-search-", "-filter-", "-info-"):
+                        window[key].update(disabled=True)
+                    changed = True
+            else:
+                logging.debug(f'Event: {event}')
+                logging.debug(str(values))
+
+            if changed:
+                visibleMods = self.updateModTable(window, values)
+                if event == "server_config":
+                    passes["server"] = server
+                    passes["syncPass"] = passes["requested"] + 1
+                passes["requested"] += 1
+                wakeup.set()
+
+        # let a requested install finish before exiting
+        if passes["done"] < passes["requested"]:
+            window["-message-"].update("Applying changes...")
+            window.refresh()
+        stopping.set()
+        wakeup.set()
+        thread.join()
+        self.progressCallback = None
+        window.close()
 
+    def updateModTable(self, window, values=None):
+        """Fills the mod table according to the search and filter inputs, returns the mod_ids of the rows."""
+        search = values["-search-"].lower() if values is not None else ""
+        mode = values["-filter-"] if values is not None else GUI_FILTERS[0]
+
+        visibleMods = []
+        rows = []
+        for mod_id in self.mods:
+            mod = self.mods[mod_id]
+            if search != "" and not search in mod["name"].lower() and not search in mod_id.lower() and not search in mod["author"].lower():
+                continue
+            if (mode == "Active" and not mod["installed"]) or (mode == "Inactive" and mod["installed"]) or (mode == "Updatable" and mod["download"] == {}):
+                continue
+
+            version = f"Latest ({self.getLatestVersion(mod_id)})" if mod["version"] == "latest" else mod["version"]
+            visibleMods.append(mod_id)
+            rows.append([
+                "yes" if mod["installed"] else "no",
+                mod["name"],
+                version,
+                mod["author"],
+                mod["sync"],
+                ("yes" if mod["update"] else "no") if mod["download"] != {} else "---"
+            ])
+
+        selected = values["-table-"] if values is not None else []
+        window["-table-"].update(values=rows, select_rows=[row for row in selected if row < len(rows)])
+        return visibleMods
+
+    def chooseVersion(self, sg, mod_id):
+        latestText = f"Latest ({self.getLatestVersion(mod_id)})"
+        versions = [*([latestText] if self.mods[mod_id]["download"] != {} else []), *self.versionIndex[mod_id].ordered()[::-1]]
+        current = latestText if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+
+        window = sg.Window("Choose version", [
+            [sg.Text(f"Version of {self.mods[mod_id]['name']}:")],
+            [sg.Combo(versions, default_value=current, readonly=True, key="-version-", size=(20, 1))],
+            [sg.OK(), sg.Cancel()]
+        ])
+        event, values = window.read()
         window.close()
+        if event != "OK":
+            return None
+        return "latest" if values["-version-"] == latestText else values["-version-"]
+
+    def showModInfo(self, sg, mod_id):
+        m = self.mods[mod_id]
+        popupText = f"Mod info for {m['name']}\n\n\n"
+        popupText += f"Mod ID: {mod_id}\n\n"
+        popupText += f"Author: {m['author']}\n\n"
+        popupText += f"Astro Build: {m['astro_build']}\n\n"
+        popupText += f"Sync: {m['sync']}\n\n"
+        popupText += f"Homepage: {m['homepage']}\n\n"
+        popupText += f"Description: \n{m['description']}\n\n"
+        popupText += f"Versions: \n{json.dumps(m['versions'], indent=2)}\n\n"
+        popupText += f"Download Data: \n{json.dumps(m['download'], indent=2)}"
+        sg.Popup(popupText, title="Mod Info")
 
     # -----------------
     #! HELPER FUNCTIONS
@@ -590,19 +1275,55 @@ class AstroModLoader():
     def getPaksInPath(self, path):
         paks = []
         for f in os.listdir(path):
-            if os.path.isfile(os.path.join(path, f)) and os.path.splitext(os.path.join(path, f))[1] == ".pak" and f != "999-AstroModIntegrator_P.pak":
+            if os.path.isfile(os.path.join(path, f)) and os.path.splitext(os.path.join(path, f))[1] == ".pak" and f != INTEGRATOR_PAK:
                 paks.append(f)
         return paks
 
+    def addToStore(self, mod_id, version):
+        path = os.path.join(self.downloadPath, self.mods[mod_id]["versions"][version]["filename"])
+        if not os.path.isfile(path):
+            return
+        sha = self.modStore.lookupHash(path)
+        if sha is None:
+            sha = self.metadataCache.getHash(path)
+
+        metadata = self.metadataCache.getCachedMetadata(path)
+        if self.modStore.addFile(path, sha, mod_id, version):
+            # path is now a link to the blob, carry the cached data over
+            self.metadataCache.setHash(path, sha)
+            if metadata is not None:
+                self.metadataCache.setMetadata(path, metadata)
+
+    def rewriteUrl(self, url):
+        # e.g. {"https://": "http://mirror:8090/https/"} to send all downloads through a mirror
+        rewrites = self.modConfig.get("url_rewrites", {})
+        if len(rewrites) == 0:
+            return url
+        from cogs.Mirror import rewriteUrl
+        return rewriteUrl(url, rewrites)
+
+    def reportProgress(self, text):
+        if self.progressCallback is not None:
+            self.progressCallback(text)
+
+    def getSession(self):
+        if self.session is None:
+            self.session = createSession()
+        return self.session
+
+    def getAstroAPI(self):
+        if self.astroAPI is None:
+            import uuid
+            from cogs.AstroAPI import AstroAPI, PLAYFAB_URL
+            # PlayFab logins need a stable custom id, one is made up per mod folder
+            if not "playfab_id" in self.modConfig:
+                self.modConfig["playfab_id"] = uuid.uuid4().hex
+                self.writeModConfig()
+            self.astroAPI = AstroAPI(self.modConfig["playfab_id"], self.getSession(), self.modConfig.get("playfab_url", PLAYFAB_URL))
+        return self.astroAPI
+
     def getMetadata(self, path):
-        with open(path, "rb") as pakFile:
-            PP = PakParser(pakFile)
-            mdFile = "metadata.json"
-            md = PP.List(mdFile)
-            ppData = {}
-            if mdFile in md:
-                ppData = json.loads(PP.Unpack(mdFile).Data)
-            return ppData
+        return readPakMetadata(path)
 
     def getVersionFromFilename(self, filename):
         if len(filename.split("_")[0].split("-")) == 3:
@@ -610,18 +1331,13 @@ class AstroModLoader():
         else:
             return "---"
 
-    def getLatestVersion(self, mod_id):     
-        return self.sortVersions(list(self.mods[mod_id]["versions"].keys()))[-1]
+    def addVersion(self, mod_id, version):
+        if not mod_id in self.versionIndex:
+            self.versionIndex[mod_id] = VersionList(mod_id)
+        self.versionIndex[mod_id].add(version)
 
-    def sortVersions(self, versions_list):
-        if len(versions_list) > 1:
-            try:
-                versions_list.sort(key=lambda s: list(map(int, s.split('.'))))
-            except Exception:
-                logging.warning("A mod has incorrect version numbering")
-                # fallback to alphabetical sort
-                versions_list.sort()
-        return versions_list
+    def getLatestVersion(self, mod_id):
+        return self.versionIndex[mod_id].latest()
 
     def setGamePath(self):
         if self.gamePath == "" and "game_path" in self.modConfig:
@@ -632,6 +1348,7 @@ class AstroModLoader():
 
         if self.gamePath == "":
             if self.gui:
+                sg = loadGui()
                 while True:
                     installPath = sg.PopupGetFolder("Choose game installation directory")
                     if installPath is None:
@@ -640,14 +1357,171 @@ class AstroModLoader():
                         self.gamePath = installPath
                         break
             else:
-                print(
-                    "No game path specified, mod integration won't be possible until one is specified in modconfig.json")
+                logging.warning("No game path specified, mod integration won't be possible until one is specified in modconfig.json")
+
+    def reportMetrics(self):
+        if self.profile:
+            logging.info(metrics.summary())
+        if self.metricsPath is not None:
+            try:
+                metrics.writeJson(self.metricsPath)
+            except IOError:
+                logging.error(f"Failed to write metrics to {self.metricsPath}")
+
+    def lookupServer(self, server):
+        """Asks PlayFab for a server, returns the tags it registered or None.
+
+        A host name is looked up with every IPv4 address it resolves to, since servers register with their IP:Port.
+        """
+        host, _, port = server.partition(":")
+        candidates = [server]
+        try:
+            for info in socket.getaddrinfo(host, None, socket.AF_INET):
+                if not f"{info[4][0]}:{port}" in candidates:
+                    candidates.append(f"{info[4][0]}:{port}")
+        except OSError:
+            logging.debug(f"Couldn't resolve {host}")
+
+        try:
+            games = self.getAstroAPI().getServers(candidates)
+        except Exception:
+            logging.warning(f"Couldn't look up {server} on PlayFab")
+            logging.debug(traceback.format_exc())
+            return None
+        for candidate in candidates:
+            if len(games[candidate]) > 0:
+                tags = games[candidate][0].get("Tags", {})
+                logging.info(f"Found {tags.get('serverName', candidate)} ({candidate}) on PlayFab")
+                return tags
+        logging.warning(f"{server} isn't registered on PlayFab, it may be offline")
+        return None
+
+    def getManifestUrl(self, server, tags=None):
+        if server.startswith("http://") or server.startswith("https://"):
+            return server
+        template = self.modConfig.get("server_manifest_url")
+        if template is None:
+            logging.error("Set server_manifest_url in modconfig.json to look up the mods of a server")
+            return None
+        host, _, port = server.partition(":")
+        try:
+            return template.format(**(tags or {}), host=host, port=port, server=server)
+        except (KeyError, IndexError) as e:
+            logging.error(f"server_manifest_url uses {e}, which isn't known for {server}")
+            return None
+
+    def writeManifest(self, path):
+        selectedVersions = {}
+        for mod_id in self.mods:
+            selectedVersions[mod_id] = self.getLatestVersion(mod_id) if self.mods[mod_id]["version"] == "latest" else self.mods[mod_id]["version"]
+        manifest = buildManifest(self.mods, selectedVersions, self.downloadPath, self.metadataCache.getHash,
+            self.modConfig.get("manifest_base_url"))
+        self.metadataCache.save()
+        writeFileAtomic(path, json.dumps(manifest, indent=4))
+        logging.info(f"Wrote the manifest of {len(manifest['mods'])} mods to {path}")
+
+    def isSyncedWith(self, entries):
+        for mod_id in self.mods:
+            if self.mods[mod_id]["sync"] == "serverclient" and self.mods[mod_id]["installed"] and not mod_id in entries:
+                return False
+        for mod_id in entries:
+            entry = entries[mod_id]
+            if not mod_id in self.mods or not self.mods[mod_id]["installed"] or self.mods[mod_id]["version"] != entry["version"]:
+                return False
+            if not os.path.isfile(os.path.join(self.downloadPath, self.mods[mod_id]["versions"][entry["version"]]["filename"])):
+                return False
+        return True
+
+    def configureForServer(self, IP):
+        """Installs the serverclient mods of a server from its manifest, returns True if the mods changed.
+
+        Only the selection is changed here, the next updateModInstallation installs it.
+        """
+        if IP is None or IP == "":
+            return False
+        tags = None
+        if not IP.startswith("http://") and not IP.startswith("https://") and self.modConfig.get("server_manifest_url") is not None:
+            # checks that the server is online, its PlayFab tags can be used in the manifest url
+            tags = self.lookupServer(IP)
+        url = self.getManifestUrl(IP, tags)
+        if url is None:
+            return False
+
+        # an unchanged manifest is revalidated with a single conditional request
+        httpCache = HttpCache(os.path.join(self.downloadPath, "manifestcache.json"))
+        try:
+            manifest = httpCache.getJson(self.getSession(), url, REQUEST_TIMEOUT)
+            httpCache.save()
+            if manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"unsupported manifest version {manifest.get('version')}")
+            if not isinstance(manifest.get("mods"), dict):
+                raise ValueError("the manifest has no mod list")
+        except Exception:
+            logging.error(f"Failed to get the mod list of {IP}")
+            logging.debug(traceback.format_exc())
+            return False
+
+        # the file names become local paths, entries that could write outside the Mods folder are skipped
+        entries = {}
+        missing = []
+        for mod_id in manifest["mods"]:
+            error = checkManifestEntry(mod_id, manifest["mods"][mod_id])
+            if error is not None:
+                logging.error(f"Skipping {mod_id} in the manifest of {IP}: {error}")
+                missing.append(mod_id)
+            else:
+                entries[mod_id] = manifest["mods"][mod_id]
+
+        syncState = SyncState(os.path.join(self.downloadPath, "serversync.json"))
+        manifestHash = getManifestHash(manifest)
+        if len(missing) == 0 and syncState.getAppliedHash(IP) == manifestHash and self.isSyncedWith(entries):
+            logging.info(f"Mods are already in sync with {IP}")
+            return False
+
+        # only download what is missing or differs from the server
+        downloads = {}
+        for mod_id in entries:
+            entry = entries[mod_id]
+            local = self.mods[mod_id]["versions"].get(entry["version"]) if mod_id in self.mods else None
+            if local is not None and os.path.isfile(os.path.join(self.downloadPath, local["filename"])):
+                if entry.get("sha256") is None or self.metadataCache.getHash(os.path.join(self.downloadPath, local["filename"])) == entry["sha256"]:
+                    continue
+            if entry.get("download_url") is None:
+                logging.error(f"{mod_id} {entry['version']} isn't available locally and {IP} doesn't offer a download")
+                missing.append(mod_id)
+                continue
+            logging.info(f"Downloading {mod_id} {entry['version']} ...")
+            self.reportProgress(f"Downloading {mod_id} {entry['version']}...")
+            downloads[mod_id] = (self.rewriteUrl(entry["download_url"]), os.path.join(self.downloadPath, entry["filename"]), entry.get("sha256"), entry.get("size"))
+
+        if len(downloads) > 0:
+            failed = DownloadManager(self.getSession(), self.modConfig.get("max_parallel_downloads", MAX_PARALLEL)).downloadAll(downloads)
+            missing += list(failed)
+            self.updateModFiles([os.path.basename(downloads[mod_id][1]) for mod_id in downloads if not mod_id in failed])
 
-    def configureForServer(self, IP):       
-        # TODO server config
-        logging.info(f"Server config {IP} (unimplemented)")
+        for mod_id in self.mods:
+            if self.mods[mod_id]["sync"] == "serverclient":
+                self.mods[mod_id]["installed"] = False
+        for mod_id in entries:
+            version = entries[mod_id]["version"]
+            if mod_id in self.mods and version in self.mods[mod_id]["versions"]:
+                self.mods[mod_id]["installed"] = True
+                self.mods[mod_id]["version"] = version
+            elif not mod_id in missing:
+                missing.append(mod_id)
+
+        if len(missing) > 0:
+            logging.error(f"Couldn't get all mods of {IP}, missing: {', '.join(missing)}")
+        else:
+            syncState.setAppliedHash(IP, manifestHash)
+            logging.info(f"Configured the mods for {IP}")
+        return True
 
 if __name__ == "__main__":
+    # needed for the metadata scan process pool in the .exe
+    if hasattr(sys, "_MEIPASS"):
+        import multiprocessing
+        multiprocessing.freeze_support()
     try:
         os.system("title AstroModLoader v" + MOD_LOADER_VERSION)
     except:
@@ -667,9 +1541,76 @@ if __name__ == "__main__":
         parser.add_argument('--debug', dest='debug', action='store_true', help="Print full logs.")
         parser.set_defaults(debug=False)
 
+        parser.add_argument('--rebuild-cache', dest='rebuild_cache', action='store_true', help="Discard the metadata cache and parse all mod files again.")
+        parser.set_defaults(rebuild_cache=False)
+
+        parser.add_argument('--jobs', dest='jobs', type=int, help="Number of processes used to parse mod metadata. Defaults to the number of CPUs, 1 disables parallel parsing.")
+        parser.set_defaults(jobs=None)
+
+        parser.add_argument('--profile', dest='profile', action='store_true', help="Print how long each phase took and how much data was read, written and downloaded.")
+        parser.set_defaults(profile=False)
+
+        parser.add_argument('--metrics-json', dest='metrics_json', help="Write phase timings and counters as json to this file.")
+        parser.set_defaults(metrics_json=None)
+
+        parser.add_argument('--mod-store', dest='mod_store', help="Folder of a content addressed mod store to share paks between several mod folders, e.g. multiple servers.")
+        parser.set_defaults(mod_store=None)
+
+        parser.add_argument('--gc', dest='gc', action='store_true', help="Delete old mod versions according to gc_max_versions and gc_max_size_mb in modconfig.json.")
+        parser.set_defaults(gc=False)
+
+        parser.add_argument('--gc-dry-run', dest='gc_dry_run', action='store_true', help="Only list the mod versions --gc would delete.")
+        parser.set_defaults(gc_dry_run=False)
+
+        parser.add_argument('--batch', dest='batch', help="Apply the commands (enable, disable, version, update) in this file, or stdin for -, with a single install pass and exit.")
+        parser.set_defaults(batch=None)
+
+        parser.add_argument('--command', dest='commands', action='append', help="A batch command like \"enable ModId\", can be repeated. Implies batch mode.")
+        parser.set_defaults(commands=None)
+
+        parser.add_argument('--watch', dest='watch', action='store_true', help="Keep running and install mods as soon as mod files or modconfig.json change.")
+        parser.set_defaults(watch=False)
+
+        parser.add_argument('--use-profile', dest='use_profile', help="Switch to a saved profile (see the profile command) on startup.")
+        parser.set_defaults(use_profile=None)
+
+        parser.add_argument('--sync-server', dest='sync_server', help="Install the mods of a server (IP:Port or the url of its manifest) on startup.")
+        parser.set_defaults(sync_server=None)
+
+        parser.add_argument('--write-manifest', dest='write_manifest', help="Write the manifest of the installed serverclient mods to this file, for clients to sync with.")
+        parser.set_defaults(write_manifest=None)
+
+        parser.add_argument('--mirror', dest='mirror', help="Don't manage mods, run a caching mirror for index files and downloads on [HOST:]PORT instead.")
+        parser.set_defaults(mirror=None)
+
+        parser.add_argument('--mirror-allow', dest='mirror_allow', action='append', help="Url prefix the mirror may fetch from, e.g. https://example.com/mods/. Can be repeated.")
+        parser.set_defaults(mirror_allow=[])
+
+        parser.add_argument('--mirror-cache', dest='mirror_cache', help="Folder the mirror stores its files in.")
+        parser.set_defaults(mirror_cache="mirror_cache")
+
+        parser.add_argument('--mirror-max-age', dest='mirror_max_age', type=int, help="Seconds the mirror serves index files without asking upstream.")
+        parser.set_defaults(mirror_max_age=60)
+
         args = parser.parse_args()
 
-        AstroModLoader(args.gui, args.server, args.update, args.debug)
+        if args.mirror is not None:
+            sys.exit(runMirror(args.mirror, args.mirror_allow, args.mirror_cache, args.mirror_max_age, args.debug))
+
+        batchCommands = None
+        if args.batch is not None or args.commands is not None:
+            batchCommands = list(args.commands or [])
+            if args.batch == "-":
+                batchCommands += sys.stdin.read().splitlines()
+            elif args.batch is not None:
+                with open(args.batch, 'r') as f:
+                    batchCommands += f.read().splitlines()
+
+        loader = AstroModLoader(args.gui, args.server, args.update, args.debug, rebuildCache=args.rebuild_cache, jobs=args.jobs,
+            profile=args.profile, metricsPath=args.metrics_json, modStorePath=os.path.abspath(args.mod_store) if args.mod_store else None,
+            gc=args.gc, gcDryRun=args.gc_dry_run, batchCommands=batchCommands, watch=args.watch, profileName=args.use_profile,
+            syncServer=args.sync_server, manifestPath=args.write_manifest)
+        sys.exit(loader.exitCode)
     except KeyboardInterrupt:
         pass
     # except Exception as err:
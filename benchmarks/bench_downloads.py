@@ -0,0 +1,149 @@
+# checks resuming and verification of mod downloads against a local http server and times them
+#
+# usage: python benchmarks/bench_downloads.py [--size 20] [--output downloads.json]
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import FileServer, generateLibrary, modFilename
+from synthpak import writeModPak
+from bench_loader import createLoader
+
+
+def getRequests(server, name):
+    return [request for request in server.requests if request["path"] == "/" + name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time resumed and verified downloads against a local http server")
+    parser.add_argument("--size", type=int, default=20, help="Size of the pak in MiB, at least 4.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+    # the interrupted download has to keep at least one whole chunk of the first half
+    if args.size < 4:
+        parser.error("--size must be at least 4")
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.CRITICAL)
+
+    from cogs.IndexFetcher import createSession
+    from cogs.DownloadManager import DownloadManager, DownloadError
+
+    tempDir = tempfile.mkdtemp()
+    failures = []
+    results = []
+    try:
+        serverPath = os.path.join(tempDir, "server")
+        os.makedirs(serverPath)
+        name = modFilename(500, "BenchMod", "1.0.0")
+        pakPath = os.path.join(serverPath, name)
+        writeModPak(pakPath, {"mod_id": "BenchMod", "version": "1.0.0"}, fillerSize=args.size * 1024 * 1024)
+        with open(pakPath, "rb") as f:
+            pakData = f.read()
+        pakSha = hashlib.sha256(pakData).hexdigest()
+        offset = len(pakData) // 3
+
+        def download(server, targetPath, sha256=pakSha):
+            start = time.perf_counter()
+            error = None
+            try:
+                DownloadManager(createSession()).download(server.baseUrl + name, targetPath, sha256=sha256, size=len(pakData))
+            except Exception as e:
+                error = e
+            seconds = time.perf_counter() - start
+            requests = getRequests(server, name)
+            results.append({"name": scenario, "bytes": len(pakData), "seconds": seconds, "requests": len(requests)})
+            print(f"{scenario:16} {len(pakData) / 1024 / 1024:6.1f} MiB {seconds * 1000:10.2f} ms  {len(requests)} requests")
+            return requests, error
+
+        def checkComplete(targetPath, error):
+            if error is not None:
+                failures.append(f"{scenario}: the download failed ({error})")
+            elif not os.path.isfile(targetPath) or hashlib.sha256(open(targetPath, "rb").read()).hexdigest() != pakSha:
+                failures.append(f"{scenario}: the downloaded file differs from the served one")
+            if os.path.isfile(targetPath + ".part"):
+                failures.append(f"{scenario}: the .part file was left behind")
+
+        # a .part file left by an earlier run is continued with a single range request
+        scenario = "resume"
+        targetPath = os.path.join(tempDir, "resume", name)
+        os.makedirs(os.path.dirname(targetPath))
+        with open(targetPath + ".part", "wb") as f:
+            f.write(pakData[:offset])
+        with FileServer(serverPath, ranges=True) as server:
+            requests, error = download(server, targetPath)
+        checkComplete(targetPath, error)
+        if [(r["range"], r["status"]) for r in requests] != [(f"bytes={offset}-", 206)]:
+            failures.append(f"{scenario}: expected one 206 answer for bytes={offset}-, got {requests}")
+
+        # a connection that drops halfway keeps the .part file, the next attempt continues it
+        scenario = "interrupted"
+        targetPath = os.path.join(tempDir, "interrupted", name)
+        os.makedirs(os.path.dirname(targetPath))
+        with FileServer(serverPath, ranges=True, interrupt=["/" + name]) as server:
+            requests, error = download(server, targetPath)
+        checkComplete(targetPath, error)
+        # only whole chunks of the cut off response end up in the .part file
+        resumedAt = int(requests[1]["range"][len("bytes="):-1]) if len(requests) == 2 and requests[1]["range"] else 0
+        if [r["status"] for r in requests] != [200, 206] or not 0 < resumedAt <= len(pakData) // 2:
+            failures.append(f"{scenario}: expected a 200 cut off halfway and a 206 for the rest, got {requests}")
+
+        # a server without range support answers 200 with the whole file, the .part file has to start over
+        scenario = "range-ignored"
+        targetPath = os.path.join(tempDir, "ignored", name)
+        os.makedirs(os.path.dirname(targetPath))
+        with open(targetPath + ".part", "wb") as f:
+            f.write(pakData[:offset])
+        with FileServer(serverPath, ranges=False) as server:
+            requests, error = download(server, targetPath)
+        checkComplete(targetPath, error)
+        if [(r["range"], r["status"]) for r in requests] != [(f"bytes={offset}-", 200)]:
+            failures.append(f"{scenario}: expected one range request answered with 200, got {requests}")
+
+        # a file that doesn't match its sha256 is rejected and nothing is left behind
+        scenario = "sha-mismatch"
+        targetPath = os.path.join(tempDir, "mismatch", name)
+        os.makedirs(os.path.dirname(targetPath))
+        with FileServer(serverPath, ranges=True) as server:
+            requests, error = download(server, targetPath, sha256="0" * 64)
+        if not isinstance(error, DownloadError):
+            failures.append(f"{scenario}: expected a DownloadError, got {error!r}")
+        if os.path.exists(targetPath) or os.path.exists(targetPath + ".part"):
+            failures.append(f"{scenario}: the rejected file was kept")
+
+        # the same through the loader: the mod stays uninstalled
+        scenario = "sha-mismatch-mod"
+        libraryPath = os.path.join(tempDir, "library")
+        generateLibrary(libraryPath, 1, installed=0, downloadable=0)
+        with FileServer(serverPath, ranges=True) as server:
+            loader = createLoader(libraryPath, "", 1)
+            loader.readModFiles()
+            loader.mods["BenchMod"] = {**loader.mods["BenchMod0"], "installed": True, "version": "1.0.0", "download": {},
+                "versions": {"1.0.0": {"filename": name, "download_url": server.baseUrl + name, "sha256": "0" * 64, "size": len(pakData)}}}
+            loader.updateModInstallation()
+        leftovers = [path for path in (os.path.join(loader.downloadPath, name), os.path.join(loader.downloadPath, name + ".part"),
+            os.path.join(loader.installPath, name)) if os.path.exists(path)]
+        if len(leftovers) > 0:
+            failures.append(f"{scenario}: the rejected file was kept or installed: {', '.join(leftovers)}")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(json.dumps({"benchmark": "downloads", "results": results, "failures": failures}, indent=4))
+    finally:
+        shutil.rmtree(tempDir)
+
+    if len(failures) > 0:
+        print("\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
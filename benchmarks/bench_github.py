@@ -0,0 +1,100 @@
+# checks github_repository updates against a local fake of the releases api and times them
+#
+# usage: python benchmarks/bench_github.py [--mods 12] [--repos 3] [--old-releases 150] [--output github.json]
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import generateLibrary, modFilename
+from fakegithub import FakeGithub
+from bench_loader import createLoader
+from cogs.GithubReleases import RELEASES_PER_PAGE
+
+
+def checkForUpdates(libraryPath, gamePath, repositories, apiUrl):
+    loader = createLoader(libraryPath, gamePath, 1)
+    loader.readModFiles()
+    loader.modConfig["github_api_url"] = apiUrl
+    for i, mod_id in enumerate(sorted(loader.mods)):
+        loader.mods[mod_id]["download"] = {"type": "github_repository", "url": f"https://github.com/{repositories[i % len(repositories)]}"}
+        loader.mods[mod_id]["update"] = True
+        loader.mods[mod_id]["version"] = "latest"
+    start = time.perf_counter()
+    loader.downloadUpdates()
+    return loader, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time github_repository updates against a fake releases api")
+    parser.add_argument("--mods", type=int, default=12)
+    parser.add_argument("--repos", type=int, default=3, help="Repositories the mods are spread over.")
+    parser.add_argument("--old-releases", type=int, default=150, help="Older releases of the first mod, more than 100 need a second page.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.WARNING)
+
+    tempDir = tempfile.mkdtemp()
+    failures = []
+    results = []
+    try:
+        libraryPath = os.path.join(tempDir, "library")
+        gamePath = os.path.join(tempDir, "game")
+        os.makedirs(gamePath)
+        library = generateLibrary(libraryPath, args.mods, withMetadata=1.0, installed=1.0, downloadable=0)["mods"]
+
+        # every mod gets a newer release, the first one also a long history
+        assetPath = os.path.join(tempDir, "assets")
+        os.makedirs(assetPath)
+        for mod in library:
+            source = os.path.join(libraryPath, "Astro", "Saved", "Mods", modFilename(mod["priority"], mod["mod_id"], mod["versions"][-1]))
+            shutil.copy(source, os.path.join(assetPath, modFilename(mod["priority"], mod["mod_id"], "2.0.0")))
+            if mod is library[0]:
+                for i in range(args.old_releases):
+                    shutil.copy(source, os.path.join(assetPath, modFilename(mod["priority"], mod["mod_id"], f"0.0.{i}")))
+
+        repositories = [f"bench/repo{i}" for i in range(args.repos)]
+        releaseCount = args.old_releases + 1
+        pages = releaseCount // RELEASES_PER_PAGE + 1
+        with FakeGithub(assetPath, repositories) as github:
+            for name in ("first", "unchanged"):
+                before = len(github.requests)
+                notModifiedBefore = github.notModified
+                loader, seconds = checkForUpdates(libraryPath, gamePath, repositories, github.baseUrl)
+                requests = len(github.requests) - before
+                notModified = github.notModified - notModifiedBefore
+                results.append({"name": name, "mods": args.mods, "repositories": args.repos, "seconds": seconds,
+                    "requests": requests, "not_modified": notModified})
+                print(f"{name:10} {args.mods} mods in {args.repos} repos {seconds * 1000:10.2f} ms  {requests} requests, {notModified} not modified")
+
+                if requests != args.repos * pages:
+                    failures.append(f"{name}: expected {args.repos * pages} listing requests, got {requests}")
+                if name == "unchanged" and notModified != requests:
+                    failures.append(f"{name}: only {notModified} of {requests} requests were answered with 304")
+                outdated = [mod_id for mod_id in loader.mods if loader.getLatestVersion(mod_id) != "2.0.0"]
+                if len(outdated) > 0:
+                    failures.append(f"{name}: the new release wasn't found for {', '.join(outdated)}")
+                if args.old_releases > 0 and not "0.0.0" in loader.mods[library[0]["mod_id"]]["versions"]:
+                    failures.append(f"{name}: the oldest release of {library[0]['mod_id']} is missing")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(json.dumps({"benchmark": "github", "results": results, "failures": failures}, indent=4))
+    finally:
+        shutil.rmtree(tempDir)
+
+    if len(failures) > 0:
+        print("\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# reports the import time breakdown of AstroModLoader.py and checks that heavy dependencies stay lazy
+#
+# usage: python benchmarks/bench_imports.py [--top 15] [--output imports.json]
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# only needed by the gui, the cli, integration, pak layouts the fast reader can't handle or network access
+LAZY_MODULES = ("PySimpleGUI", "terminaltables", "clr", "PyPAKParser", "requests", "pprint", "multiprocessing", "cogs.AstroAPI")
+
+
+def measureImports():
+    """Returns a list of (module, self microseconds, cumulative microseconds) in import order."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import AstroModLoader"],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing AstroModLoader failed:\n{result.stderr}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selfTime, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(selfTime), int(cumulative)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time breakdown of AstroModLoader.py")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    imports = measureImports()
+    total = [i for i in imports if i[0] == "AstroModLoader"][0][2]
+    print(f"import AstroModLoader: {total / 1000:.1f} ms")
+    for name, selfTime, cumulative in sorted(imports, key=lambda i: -i[2])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {selfTime / 1000:8.1f} ms self  {name}")
+
+    loaded = set(i[0] for i in imports)
+    eager = [m for m in LAZY_MODULES if m in loaded]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps({
+                "benchmark": "imports",
+                "results": [{"name": "import AstroModLoader", "seconds": total / 1000000}] +
+                    [{"name": name, "self_s": selfTime / 1000000, "cumulative_s": cumulative / 1000000} for name, selfTime, cumulative in imports],
+                "eager_lazy_modules": eager
+            }, indent=4))
+
+    if len(eager) > 0:
+        print(f"Modules that should be imported lazily were imported eagerly: {', '.join(eager)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# times the main AstroModLoader phases on synthetic mod libraries
+#
+# usage: python benchmarks/bench_loader.py [--sizes 10,100,1000] [--repeat 3] [--output results.json]
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import generateLibrary, writeServerFiles, FileServer
+
+
+def createLoader(basePath, gamePath, jobs, rebuildCache=False):
+    """Builds a loader for basePath without running the startup sequence or any interface."""
+    from AstroModLoader import AstroModLoader
+    from cogs.ModIntegration import StubIntegrator
+    from cogs.IndexFetcher import createSession
+
+    loader = AstroModLoader.__new__(AstroModLoader)
+    loader.gui = False
+    loader.serverMode = True
+    loader.updateOnly = True
+    loader.readonly = False
+    loader.rebuildCache = rebuildCache
+    loader.integratorBackend = StubIntegrator
+    loader.jobs = jobs
+    loader.modStorePath = None
+    loader.basePath = basePath
+    loader.downloadPath = os.path.join(basePath, "Astro", "Saved", "Mods")
+    loader.installPath = os.path.join(basePath, "Astro", "Saved", "Paks")
+    loader.gamePath = gamePath
+    loader.session = createSession()
+    loader.astroAPI = None
+    loader.modConfigPending = None
+    loader.modConfigWritten = 0
+    loader.progressCallback = None
+    return loader
+
+
+def timeRuns(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def benchSize(count, repeat, jobs, fillerSize, results):
+    tempDir = tempfile.mkdtemp()
+    try:
+        basePath = os.path.join(tempDir, "server")
+        gamePath = os.path.join(tempDir, "game")
+        serverPath = os.path.join(tempDir, "upstream")
+        os.makedirs(os.path.join(gamePath, "Astro", "Content", "Paks"))
+        os.makedirs(serverPath)
+
+        with FileServer(serverPath) as server:
+            library = generateLibrary(basePath, count, fillerSize=fillerSize, indexBaseUrl=server.baseUrl)
+            writeServerFiles(serverPath, library, server.baseUrl, fillerSize=fillerSize)
+
+            def record(name, runs):
+                result = {"name": name, "mods": count, "seconds": min(runs), "runs": runs}
+                results.append(result)
+                print(f"{count:5} mods  {name:32} {result['seconds'] * 1000:10.2f} ms")
+
+            # metadata scan without and with the metadata cache
+            def coldScan():
+                createLoader(basePath, gamePath, jobs, rebuildCache=True).readModFiles()
+            record("readModFiles.cold", timeRuns(coldScan, repeat))
+
+            loader = createLoader(basePath, gamePath, jobs)
+            record("readModFiles.warm", timeRuns(loader.readModFiles, repeat))
+
+            # update checks without and with the http cache
+            httpCachePath = os.path.join(loader.downloadPath, "httpcache.json")
+
+            def coldUpdate():
+                if os.path.isfile(httpCachePath):
+                    os.remove(httpCachePath)
+                loader.readModFiles()
+                loader.downloadUpdates()
+            record("readModFiles+downloadUpdates.cold", timeRuns(coldUpdate, repeat))
+
+            def warmUpdate():
+                loader.readModFiles()
+                loader.downloadUpdates()
+            record("readModFiles+downloadUpdates.warm", timeRuns(warmUpdate, repeat))
+
+            # the first pass downloads, integrates and installs, the following ones have nothing to do
+            record("updateModInstallation.first", timeRuns(loader.updateModInstallation, 1))
+            record("updateModInstallation.noop", timeRuns(loader.updateModInstallation, repeat))
+
+            def latestVersions():
+                for mod_id in loader.mods:
+                    loader.getLatestVersion(mod_id)
+                    loader.versionIndex[mod_id].ordered()
+            record("getLatestVersion+orderedVersions", timeRuns(latestVersions, repeat))
+    finally:
+        shutil.rmtree(tempDir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AstroModLoader phases on synthetic libraries")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma separated library sizes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one is reported.")
+    parser.add_argument("--jobs", type=int, default=1, help="Metadata scan processes.")
+    parser.add_argument("--filler", type=int, default=0, help="Extra bytes of payload per pak.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.WARNING)
+
+    from AstroModLoader import MOD_LOADER_VERSION
+
+    results = []
+    for count in [int(s) for s in args.sizes.split(",")]:
+        benchSize(count, args.repeat, args.jobs, args.filler, results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps({
+                "benchmark": "loader",
+                "loader_version": MOD_LOADER_VERSION,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "jobs": args.jobs,
+                "filler": args.filler,
+                "results": results
+            }, indent=4))
+
+
+if __name__ == "__main__":
+    main()
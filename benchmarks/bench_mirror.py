@@ -0,0 +1,149 @@
+# checks the caching mirror against a local fake upstream: every file should be fetched from upstream once,
+# served unchanged, revalidated when stale, resumable and only for allowed upstreams
+#
+# usage: python benchmarks/bench_mirror.py [--clients 20] [--size 50] [--output results.json]
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import FileServer
+from synthpak import writeModPak
+
+
+def runClient(fn, i):
+    try:
+        fn(i)
+    except Exception as e:
+        return e
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the caching mirror with many concurrent clients")
+    parser.add_argument("--clients", type=int, default=20, help="Concurrent clients downloading the same files.")
+    parser.add_argument("--size", type=int, default=50, help="Size of the pak in MiB.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.WARNING)
+
+    from cogs.Mirror import MirrorCache, MirrorServer, rewriteUrl
+    from cogs.IndexFetcher import createSession
+    from cogs.DownloadManager import DownloadManager
+    from cogs.Metrics import metrics
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        upstreamPath = os.path.join(tempDir, "upstream")
+        os.makedirs(upstreamPath)
+        pakPath = os.path.join(upstreamPath, "000-BenchMod-1.0.0_P.pak")
+        writeModPak(pakPath, {"mod_id": "BenchMod", "version": "1.0.0"}, fillerSize=args.size * 1024 * 1024)
+        with open(os.path.join(upstreamPath, "index.json"), "w") as f:
+            f.write(json.dumps({"mods": {}}))
+
+        with open(pakPath, "rb") as f:
+            pakData = f.read()
+        pakSha = hashlib.sha256(pakData).hexdigest()
+
+        results = []
+        failures = []
+        metrics.enabled = True
+        with FileServer(upstreamPath) as upstream:
+            cache = MirrorCache(os.path.join(tempDir, "cache"), createSession(args.clients))
+            with MirrorServer(cache, [upstream.baseUrl]) as mirror:
+                rewrites = {upstream.baseUrl: mirror.baseUrl + upstream.baseUrl.replace("://", "/", 1)}
+                indexUrl = rewriteUrl(upstream.baseUrl + "index.json", rewrites)
+                pakUrl = rewriteUrl(upstream.baseUrl + os.path.basename(pakPath), rewrites)
+                session = createSession(args.clients)
+
+                def fetchIndex(i):
+                    r = session.get(indexUrl, timeout=30)
+                    r.raise_for_status()
+                    if r.json() != {"mods": {}}:
+                        raise ValueError(f"client {i} got a wrong index file")
+
+                def downloadPak(i):
+                    # verified against the upstream hash, a wrong file raises
+                    DownloadManager(session).download(pakUrl, os.path.join(tempDir, f"client{i}.pak"), sha256=pakSha, size=len(pakData))
+
+                for name, fn in (("index", fetchIndex), ("pak", downloadPak), ("pak.cached", downloadPak)):
+                    before = cache.upstreamRequests
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+                        errors = [e for e in pool.map(lambda i: runClient(fn, i), range(args.clients)) if e is not None]
+                    result = {"name": name, "clients": args.clients, "seconds": time.perf_counter() - start,
+                        "upstream_requests": cache.upstreamRequests - before}
+                    results.append(result)
+                    print(f"{name:12} {args.clients} clients {result['seconds'] * 1000:10.2f} ms  {result['upstream_requests']} upstream requests")
+
+                    if len(errors) > 0:
+                        failures.append(f"{name}: {len(errors)} of {args.clients} clients failed, e.g. {errors[0]}")
+                    expected = 0 if name == "pak.cached" else 1
+                    if result["upstream_requests"] != expected:
+                        failures.append(f"{name}: expected {expected} upstream requests, got {result['upstream_requests']}")
+
+                # the mirror's own validators
+                r = session.get(indexUrl, timeout=30)
+                etag = r.headers.get("ETag")
+                r = session.get(indexUrl, headers={"If-None-Match": etag}, timeout=30)
+                if etag is None or r.status_code != 304:
+                    failures.append(f"etag: expected 304 for a matching If-None-Match, got {r.status_code}")
+
+                # a stale index file is revalidated upstream instead of fetched again
+                cache.maxAge = 0
+                before = cache.upstreamRequests
+                revalidatedBefore = metrics.counters.get("mirror_revalidated", 0)
+                r = session.get(indexUrl, timeout=30)
+                if r.status_code != 200 or r.json() != {"mods": {}}:
+                    failures.append(f"revalidate: got {r.status_code} after revalidating the index file")
+                if cache.upstreamRequests - before != 1 or metrics.counters.get("mirror_revalidated", 0) - revalidatedBefore != 1:
+                    failures.append("revalidate: the stale index file wasn't revalidated with a single 304 from upstream")
+
+                # ranges are answered from the cached file
+                offset = len(pakData) // 3
+                r = session.get(pakUrl, headers={"Range": f"bytes={offset}-", "Accept-Encoding": "identity"}, timeout=30)
+                if r.status_code != 206 or r.content != pakData[offset:]:
+                    failures.append(f"range: expected 206 with the rest of the pak, got {r.status_code} with {len(r.content)} bytes")
+
+                # an interrupted download resumes through the mirror
+                resumePath = os.path.join(tempDir, "resumed.pak")
+                with open(resumePath + ".part", "wb") as f:
+                    f.write(pakData[:offset])
+                try:
+                    DownloadManager(session).download(pakUrl, resumePath, sha256=pakSha, size=len(pakData))
+                except Exception as e:
+                    failures.append(f"resume: {e}")
+
+                # other hosts are refused, also ones that only share the allowed prefix
+                port = upstream.server.server_port
+                before = cache.upstreamRequests
+                for url in (f"{mirror.baseUrl}http/example.com/index.json", f"{mirror.baseUrl}http/127.0.0.1:{port}0/index.json"):
+                    r = session.get(url, timeout=30)
+                    if r.status_code != 403:
+                        failures.append(f"allowlist: expected 403 for {url}, got {r.status_code}")
+                if cache.upstreamRequests != before:
+                    failures.append("allowlist: a refused request was fetched from upstream")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(json.dumps({"benchmark": "mirror", "results": results, "failures": failures}, indent=4))
+    finally:
+        shutil.rmtree(tempDir)
+
+    if len(failures) > 0:
+        print("\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
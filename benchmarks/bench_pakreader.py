@@ -0,0 +1,86 @@
+# compares metadata extraction with cogs.PakReader against PyPAKParser on synthetic paks
+#
+# usage: python benchmarks/bench_pakreader.py [--output results.json]
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.PakReader import readMetadata
+from synthpak import writeModPak
+
+# (filler bytes, extra index entries)
+CASES = (
+    (1024 * 1024, 0),
+    (64 * 1024 * 1024, 0),
+    (256 * 1024 * 1024, 0),
+    (1024 * 1024, 1000),
+    (1024 * 1024, 10000)
+)
+VERSIONS = (4, 8)
+REPEATS = 20
+
+
+def readWithPyPAKParser(path):
+    from PyPAKParser import PakParser
+    with open(path, "rb") as pakFile:
+        PP = PakParser(pakFile)
+        mdFile = "metadata.json"
+        md = PP.List(mdFile)
+        if mdFile in md:
+            return json.loads(PP.Unpack(mdFile).Data)
+        return {}
+
+
+def timeIt(fn, path):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn(path)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pak metadata extraction")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    tempDir = tempfile.mkdtemp()
+    results = []
+    try:
+        for version in VERSIONS:
+            for fillerSize, extraEntries in CASES:
+                path = os.path.join(tempDir, "000-Bench-1.0.0_P.pak")
+                writeModPak(path, {"mod_id": "Bench", "version": "1.0.0"}, version, True, fillerSize, extraEntries)
+
+                result = {
+                    "version": version,
+                    "pak_size": os.path.getsize(path),
+                    "entries": extraEntries + 3,
+                    "pakreader_s": timeIt(readMetadata, path)
+                }
+                try:
+                    result["pypakparser_s"] = timeIt(readWithPyPAKParser, path)
+                except ImportError:
+                    result["pypakparser_s"] = None
+                results.append(result)
+
+                print(f"v{version} {result['pak_size'] / 1024 / 1024:8.1f} MiB {result['entries']:6} entries: "
+                    f"PakReader {result['pakreader_s'] * 1000:8.3f} ms, "
+                    f"PyPAKParser {result['pypakparser_s'] * 1000 if result['pypakparser_s'] is not None else float('nan'):8.3f} ms")
+                os.remove(path)
+    finally:
+        shutil.rmtree(tempDir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps({"benchmark": "pakreader", "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# compares two benchmark result files, e.g. from two releases
+#
+# usage: python benchmarks/compare.py old.json new.json
+
+import sys
+import json
+
+
+def isMeasurement(field):
+    return field == "seconds" or field.endswith("_s")
+
+
+def resultKey(result):
+    return tuple((k, result[k]) for k in sorted(result) if not isMeasurement(k) and k != "runs")
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: compare.py old.json new.json")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as f:
+        old = json.loads(f.read())
+    with open(sys.argv[2], "r") as f:
+        new = json.loads(f.read())
+
+    oldResults = {resultKey(r): r for r in old["results"]}
+    for result in new["results"]:
+        key = resultKey(result)
+        label = " ".join(f"{k}={v}" for k, v in key)
+        if key not in oldResults:
+            print(f"{label}: new")
+            continue
+        for field in sorted(result):
+            if not isMeasurement(field) or result[field] is None or oldResults[key].get(field) is None:
+                continue
+            before = oldResults[key][field]
+            after = result[field]
+            change = (after - before) / before * 100 if before > 0 else 0.0
+            print(f"{label} {field}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# local stand-in for the github releases api, for trying github_repository updates offline
+#
+# usage: python benchmarks/fakegithub.py PAK_FOLDER OWNER/REPO [--port 8081]
+# then set "github_api_url" in modconfig.json to the printed url
+
+import os
+import json
+import hashlib
+import argparse
+import threading
+from urllib.parse import unquote, urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def sendBody(self, status, body, contentType, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for name in (headers or {}):
+            self.send_header(name, headers[name])
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        path = unquote(urlsplit(self.path).path)
+        query = parse_qs(urlsplit(self.path).query)
+        with fake.lock:
+            fake.requests.append(path)
+
+        parts = path.strip("/").split("/")
+        if len(parts) == 4 and parts[0] == "repos" and parts[3] == "releases":
+            releases = fake.getReleases(f"{parts[1]}/{parts[2]}")
+            if releases is None:
+                return self.sendBody(404, b'{"message": "Not Found"}', "application/json")
+            perPage = int(query.get("per_page", ["30"])[0])
+            page = int(query.get("page", ["1"])[0])
+            body = json.dumps(releases[(page - 1) * perPage:page * perPage]).encode("utf-8")
+            headers = {}
+            if page * perPage < len(releases):
+                headers["Link"] = f'<{fake.baseUrl}/repos/{parts[1]}/{parts[2]}/releases?per_page={perPage}&page={page + 1}>; rel="next"'
+            etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                with fake.lock:
+                    fake.notModified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            headers["ETag"] = etag
+            return self.sendBody(200, body, "application/json", headers)
+
+        if len(parts) == 2 and parts[0] == "assets" and os.path.isfile(os.path.join(fake.assetPath, parts[1])):
+            with open(os.path.join(fake.assetPath, parts[1]), "rb") as f:
+                return self.sendBody(200, f.read(), "application/octet-stream")
+
+        self.sendBody(404, b'{"message": "Not Found"}', "application/json")
+
+
+class FakeGithub():
+    """Lists the paks in assetPath as releases of the given repositories.
+
+    Every file name "PRIORITY-MODID-VERSION_P.pak" becomes an asset of the release tagged VERSION.
+    """
+
+    def __init__(self, assetPath, repositories, port=0):
+        self.assetPath = assetPath
+        self.repositories = repositories
+        self.requests = []
+        self.notModified = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), FakeGithubHandler)
+        self.server.fake = self
+        self.baseUrl = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def getReleases(self, repository):
+        if not repository in self.repositories:
+            return None
+        releases = {}
+        for name in sorted(os.listdir(self.assetPath)):
+            if not name.endswith(".pak"):
+                continue
+            parts = name.split("_")[0].split("-")
+            tag = parts[2] if len(parts) == 3 else "0.0.0"
+            releases.setdefault(tag, []).append({
+                "name": name,
+                "size": os.path.getsize(os.path.join(self.assetPath, name)),
+                "browser_download_url": f"{self.baseUrl}/assets/{name}"
+            })
+        # newest first like the real api
+        tags = sorted(releases, key=lambda tag: [int(part) if part.isdigit() else part for part in tag.split(".")], reverse=True)
+        return [{"tag_name": tag, "draft": False, "prerelease": False, "assets": releases[tag]} for tag in tags]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake github releases api on localhost")
+    parser.add_argument("assets", help="Folder with the pak files to list as release assets.")
+    parser.add_argument("repositories", nargs="+", help="Repositories (owner/repo) that list the assets.")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    fake = FakeGithub(args.assets, args.repositories, port=args.port)
+    print(f"Fake github api listening on {fake.baseUrl}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
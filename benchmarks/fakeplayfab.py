@@ -0,0 +1,99 @@
+# local stand-in for the PlayFab endpoints used by cogs/AstroAPI, for trying the server lookup offline
+#
+# usage: python benchmarks/fakeplayfab.py [--port 8080] [--servers 100]
+
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePlayFabHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def sendJson(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0]
+        with fake.lock:
+            fake.requests.append(path)
+            failing = fake.failures > 0
+            if failing:
+                fake.failures -= 1
+        if failing:
+            return self.sendJson(503, {"code": 503, "status": "ServiceUnavailable"})
+
+        if path == "/Client/LoginWithCustomID":
+            ticket = uuid.uuid4().hex
+            with fake.lock:
+                fake.tickets[ticket] = time.time() + fake.ticketLifetime
+            return self.sendJson(200, {"code": 200, "status": "OK", "data": {"SessionTicket": ticket}})
+
+        if path == "/Client/GetCurrentGames":
+            expires = fake.tickets.get(self.headers.get("X-Authorization"))
+            if expires is None or time.time() >= expires:
+                return self.sendJson(401, {"code": 401, "status": "Unauthorized", "error": "NotAuthenticated", "errorCode": 1074})
+            wanted = [include["Data"]["gameId"] for include in body.get("TagFilter", {}).get("Includes", [])]
+            games = [fake.games[gameId] for gameId in wanted if gameId in fake.games]
+            return self.sendJson(200, {"code": 200, "status": "OK", "data": {"Games": games, "GameCount": len(games)}})
+
+        self.sendJson(404, {"code": 404, "status": "NotFound", "errorMessage": f"unknown endpoint {path}"})
+
+
+class FakePlayFab():
+    """Answers LoginWithCustomID and GetCurrentGames on localhost in a background thread.
+
+    games maps "IP:Port" to extra tags of that server. failures makes the next requests fail with 503.
+    """
+
+    def __init__(self, games=None, ticketLifetime=3600, failures=0, port=0):
+        self.games = {}
+        for gameId, tags in (games or {}).items():
+            self.games[gameId] = {"Tags": {"gameId": gameId, **tags}, "LobbyID": uuid.uuid4().hex}
+        self.ticketLifetime = ticketLifetime
+        self.failures = failures
+        self.tickets = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), FakePlayFabHandler)
+        self.server.fake = self
+        self.baseUrl = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake PlayFab endpoints on localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--servers", type=int, default=100, help="Number of fake servers, at 127.0.0.1:7777 and up.")
+    args = parser.parse_args()
+
+    fake = FakePlayFab({f"127.0.0.1:{7777 + i}": {"serverName": f"Server {i}"} for i in range(args.servers)}, port=args.port)
+    print(f"Fake PlayFab listening on {fake.baseUrl}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# generates synthetic mod libraries, index files and a local http server to serve them
+
+import os
+import json
+import random
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from synthpak import writeModPak
+
+
+def modFilename(priority, mod_id, version):
+    return f"{priority:03}-{mod_id}-{version}_P.pak"
+
+
+def generateLibrary(basePath, count, withMetadata=0.8, installed=0.5, downloadable=0.5, modsPerIndex=10,
+        versionsPerMod=1, fillerSize=0, indexBaseUrl="", seed=0):
+    """Creates Astro/Saved/Mods and Astro/Saved/Paks under basePath and returns a description of the library.
+
+    Downloadable mods point at index files under indexBaseUrl, which list one newer version each.
+    Use writeServerFiles to create the files the index server has to serve.
+    """
+    rng = random.Random(seed)
+    modsPath = os.path.join(basePath, "Astro", "Saved", "Mods")
+    paksPath = os.path.join(basePath, "Astro", "Saved", "Paks")
+    os.makedirs(modsPath, exist_ok=True)
+    os.makedirs(paksPath, exist_ok=True)
+
+    mods = []
+    for i in range(count):
+        mod_id = f"BenchMod{i}"
+        hasMetadata = rng.random() < withMetadata
+        isDownloadable = hasMetadata and rng.random() < downloadable
+        mod = {
+            "mod_id": mod_id,
+            "priority": 100 + i % 800,
+            "versions": [f"1.0.{v}" for v in range(versionsPerMod)],
+            "metadata": hasMetadata,
+            "installed": rng.random() < installed,
+            "index": f"index{i // modsPerIndex}.json" if isDownloadable else None
+        }
+        mods.append(mod)
+
+        for version in mod["versions"]:
+            metadata = None
+            if hasMetadata:
+                metadata = {
+                    "name": f"Benchmark mod {i}",
+                    "mod_id": mod_id,
+                    "author": "bench",
+                    "version": version,
+                    "sync": "serverclient"
+                }
+                if isDownloadable:
+                    metadata["download"] = {"type": "index_file", "url": indexBaseUrl + mod["index"]}
+            filename = modFilename(mod["priority"], mod_id, version)
+            writeModPak(os.path.join(modsPath, filename), metadata, fillerSize=fillerSize)
+
+        if mod["installed"]:
+            filename = modFilename(mod["priority"], mod_id, mod["versions"][-1])
+            with open(os.path.join(modsPath, filename), "rb") as src, open(os.path.join(paksPath, filename), "wb") as dst:
+                dst.write(src.read())
+
+    with open(os.path.join(modsPath, "modconfig.json"), "w") as f:
+        f.write(json.dumps({"mods": {}}))
+
+    return {"mods_path": modsPath, "paks_path": paksPath, "mods": mods}
+
+
+def nextVersion(mod):
+    return f"1.0.{len(mod['versions'])}"
+
+
+def writeServerFiles(serverPath, library, baseUrl, fillerSize=0):
+    """Writes the index files and the newer pak versions they point to."""
+    os.makedirs(serverPath, exist_ok=True)
+    indexes = {}
+    for mod in library["mods"]:
+        if mod["index"] is None:
+            continue
+        version = nextVersion(mod)
+        filename = modFilename(mod["priority"], mod["mod_id"], version)
+        writeModPak(os.path.join(serverPath, filename), {"mod_id": mod["mod_id"], "version": version}, fillerSize=fillerSize)
+
+        if mod["index"] not in indexes:
+            indexes[mod["index"]] = {"mods": {}}
+        indexes[mod["index"]]["mods"][mod["mod_id"]] = {
+            "latest_version": version,
+            "versions": {
+                version: {
+                    "download_url": baseUrl + filename,
+                    "filename": filename,
+                    "size": os.path.getsize(os.path.join(serverPath, filename))
+                }
+            }
+        }
+
+    for name in indexes:
+        with open(os.path.join(serverPath, name), "w") as f:
+            f.write(json.dumps(indexes[name]))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def log_request(self, code="-", size="-"):
+        with self.server.lock:
+            self.server.requests.append({"path": self.path, "range": self.headers.get("Range"), "status": int(code)})
+
+
+class RangeHandler(QuietHandler):
+    """Answers "Range: bytes=N-" with 206 and can drop the connection halfway through a full response."""
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return self.send_error(404)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        rangeHeader = self.headers.get("Range", "")
+        start = int(rangeHeader[len("bytes="):-1]) if rangeHeader.startswith("bytes=") and rangeHeader.endswith("-") else 0
+        if start >= len(data) and start > 0:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(206 if start > 0 else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("Accept-Ranges", "bytes")
+        if start > 0:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.end_headers()
+
+        with self.server.lock:
+            interrupt = start == 0 and self.path in self.server.interrupt
+            self.server.interrupt.discard(self.path)
+        if interrupt:
+            # less than promised in Content-Length, the client sees a broken connection
+            self.wfile.write(data[:len(data) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+
+class FileServer():
+    """Serves a folder over http on localhost in a background thread.
+
+    With ranges=True it answers Range requests, and the paths in interrupt are cut off once halfway through.
+    Every request is recorded in requests.
+    """
+
+    def __init__(self, path, ranges=False, interrupt=()):
+        handler = RangeHandler if ranges else QuietHandler
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=path))
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.interrupt = set(interrupt)
+        self.requests = self.server.requests
+        self.baseUrl = f"http://127.0.0.1:{self.server.server_port}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
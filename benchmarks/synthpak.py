@@ -0,0 +1,103 @@
+# writes synthetic UE4 pak files for benchmarks
+
+import json
+import zlib
+import struct
+import hashlib
+
+PAK_MAGIC = 0x5A6F12E1
+COMPRESSION_BLOCK_SIZE = 0x10000
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+def packString(value):
+    raw = value.encode("iso-8859-1") + b"\x00"
+    return struct.pack("<i", len(raw)) + raw
+
+
+def packEntry(version, offset, data, storedSize, compression, blocks):
+    out = struct.pack("<qqqI", offset, storedSize, len(data), compression)
+    if version < 2:
+        out += struct.pack("<q", 0)
+    out += hashlib.sha1(data).digest()
+    if version >= 3:
+        if compression != 0:
+            out += struct.pack("<i", len(blocks))
+            for start, end in blocks:
+                out += struct.pack("<qq", start, end)
+        out += struct.pack("<BI", 0, COMPRESSION_BLOCK_SIZE if compression != 0 else 0)
+    return out
+
+
+def entryHeaderSize(version, blockCount, compressed):
+    return len(packEntry(version, 0, b"", 0, 1 if compressed else 0, [(0, 0)] * blockCount))
+
+
+def writePak(path, files, version=4, compress=False, fillerSize=0):
+    """files maps names to bytes, fillerSize adds an uncompressed entry of that many zero bytes."""
+    index = []
+    # uncompressed / zlib flag for legacy versions, index into the compression names from version 8 on
+    zlibMethod = 1
+    with open(path, "wb") as f:
+        for name in files:
+            data = files[name]
+            offset = f.tell()
+            if compress:
+                chunks = [zlib.compress(data[i:i + COMPRESSION_BLOCK_SIZE]) for i in range(0, len(data), COMPRESSION_BLOCK_SIZE)]
+                headerSize = entryHeaderSize(version, len(chunks), True)
+                base = 0 if version >= 5 else offset
+                blocks = []
+                position = headerSize
+                for chunk in chunks:
+                    blocks.append((base + position, base + position + len(chunk)))
+                    position += len(chunk)
+                payload = b"".join(chunks)
+                header = packEntry(version, 0, data, len(payload), zlibMethod, blocks)
+                index.append(packString(name) + packEntry(version, offset, data, len(payload), zlibMethod, blocks))
+            else:
+                payload = data
+                header = packEntry(version, 0, data, len(data), 0, [])
+                index.append(packString(name) + packEntry(version, offset, data, len(data), 0, []))
+            f.write(header)
+            f.write(payload)
+
+        if fillerSize > 0:
+            offset = f.tell()
+            # the filler is never read, so its hash doesn't have to match
+            header = packEntry(version, 0, b"", fillerSize, 0, [])
+            header = header[:16] + struct.pack("<q", fillerSize) + header[24:]
+            f.write(header)
+            zeros = b"\x00" * WRITE_CHUNK_SIZE
+            remaining = fillerSize
+            while remaining > 0:
+                f.write(zeros[:min(remaining, WRITE_CHUNK_SIZE)])
+                remaining -= WRITE_CHUNK_SIZE
+            fillerEntry = packEntry(version, offset, b"", fillerSize, 0, [])
+            index.append(packString("Astro/Content/Filler.uasset") + fillerEntry[:16] + struct.pack("<q", fillerSize) + fillerEntry[24:])
+
+        indexData = packString("../../../") + struct.pack("<i", len(index)) + b"".join(index)
+        indexOffset = f.tell()
+        f.write(indexData)
+
+        if version >= 7:
+            f.write(b"\x00" * 16)
+        if version >= 4:
+            f.write(b"\x00")
+        f.write(struct.pack("<IiQQ", PAK_MAGIC, version, indexOffset, len(indexData)))
+        f.write(hashlib.sha1(indexData).digest())
+        if version == 9:
+            f.write(b"\x00")  # bIndexIsFrozen
+        if version >= 8:
+            names = [b"Zlib", b"", b"", b"", b""]
+            f.write(b"".join(n.ljust(32, b"\x00") for n in names))
+
+
+def writeModPak(path, metadata=None, version=4, compress=False, fillerSize=0, extraEntries=0):
+    """extraEntries adds small assets that are indexed before metadata.json."""
+    files = {}
+    for i in range(extraEntries):
+        files[f"Astro/Content/Mod/Asset{i}.uasset"] = b"\x00" * 64
+    if metadata is not None:
+        files["metadata.json"] = json.dumps(metadata, indent=4).encode("utf-8")
+    files["Astro/Content/Mod/Dummy.uasset"] = b"\x00" * 128
+    writePak(path, files, version, compress, fillerSize)
@@ -1,35 +1,103 @@
 # original https://github.com/ricky-davis/AstroLauncher/blob/master/cogs/AstroAPI.py
 
-import requests
+import time
+import logging
+
+from cogs.IndexFetcher import createSession
+from cogs.Metrics import metrics
+
+PLAYFAB_URL = "https://5EA1.playfabapi.com"
+SDK_VERSION = "UE4MKPL-1.19.190610"
+TITLE_ID = "5EA1"
+REQUEST_TIMEOUT = 15
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+# PlayFab session tickets are valid for 24 hours, renew them a bit earlier
+TICKET_LIFETIME = 23 * 60 * 60
+# number of servers asked for in one GetCurrentGames request
+BATCH_SIZE = 20
 
 base_headers = {'Content-Type': 'application/json; charset=utf-8',
-                'X-PlayFabSDK': 'UE4MKPL-1.19.190610',
+                'X-PlayFabSDK': SDK_VERSION,
                 'User-Agent': 'game=Astro, engine=UE4, version=4.18.2-0+++UE4+Release-4.18, platform=Windows, osver=6.2.9200.1.256.64bit'
                 }
 
 
-def generate_XAUTH(serverGUID):
-    url = "https://5EA1.playfabapi.com/Client/LoginWithCustomID?sdk=UE4MKPL-1.19.190610"
-    requestObj = {
-        "CreateAccount": True,
-        "CustomId": serverGUID,
-        "TitleId": "5EA1"
-    }
-    x = (requests.post(url, headers=base_headers, json=requestObj)).json()
-    return x['data']['SessionTicket']
+class AstroAPIError(Exception):
+    pass
+
 
+class AstroAPI():
+    """PlayFab client that reuses its connection and session ticket between calls."""
 
-def get_servers(ipPortCombo, headers):
-    url = 'https://5EA1.playfabapi.com/Client/GetCurrentGames?sdk=UE4MKPL-1.19.190610'
-    requestObj = {
-        """TagFilter": {
-            "Includes": [
-                {"Data": {"gameId": ipPortCombo}}
-            ]
-        }"""
-    }
-    x = (requests.post(url, headers=headers, json=requestObj)).json()
-    return x
+    def __init__(self, serverGUID, session=None, baseUrl=PLAYFAB_URL, timeout=REQUEST_TIMEOUT):
+        self.serverGUID = serverGUID
+        self.session = session if session is not None else createSession()
+        self.baseUrl = baseUrl.rstrip("/")
+        self.timeout = timeout
+        self.ticket = None
+        self.ticketExpires = 0
 
+    def post(self, path, body, authenticated=True):
+        """Posts to a PlayFab endpoint and returns the data of the response, retrying with backoff."""
+        url = f"{self.baseUrl}{path}?sdk={SDK_VERSION}"
+        lastError = None
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(BACKOFF_BASE * 2 ** (attempt - 1))
 
+            headers = dict(base_headers)
+            if authenticated:
+                headers["X-Authorization"] = self.getSessionTicket()
+            try:
+                r = self.session.post(url, headers=headers, json=body, timeout=self.timeout)
+                metrics.count("bytes_downloaded", len(r.content))
+            except Exception as e:
+                lastError = e
+                logging.debug(f"Request to {path} failed: {e}")
+                continue
 
+            if r.status_code == 401 and authenticated:
+                # the ticket was revoked or expired early
+                self.ticket = None
+                lastError = AstroAPIError("session ticket rejected")
+            elif r.status_code == 429 or r.status_code >= 500:
+                lastError = AstroAPIError(f"{path} returned {r.status_code}")
+            else:
+                try:
+                    response = r.json()
+                except ValueError:
+                    raise AstroAPIError(f"{path} returned no json")
+                if r.status_code != 200 or not "data" in response:
+                    raise AstroAPIError(f"{path} failed: {response.get('errorMessage', r.status_code)}")
+                return response["data"]
+            logging.debug(f"Request to {path} failed: {lastError}")
+        raise AstroAPIError(f"{path} failed after {MAX_ATTEMPTS} attempts: {lastError}")
+
+    def getSessionTicket(self):
+        if self.ticket is None or time.time() >= self.ticketExpires:
+            data = self.post("/Client/LoginWithCustomID", {
+                "CreateAccount": True,
+                "CustomId": self.serverGUID,
+                "TitleId": TITLE_ID
+            }, authenticated=False)
+            self.ticket = data["SessionTicket"]
+            self.ticketExpires = time.time() + TICKET_LIFETIME
+        return self.ticket
+
+    def getServers(self, ipPortCombos):
+        """Returns a dict mapping each "IP:Port" to the list of games PlayFab knows for it."""
+        ipPortCombos = list(ipPortCombos)
+        servers = {ipPort: [] for ipPort in ipPortCombos}
+        for start in range(0, len(ipPortCombos), BATCH_SIZE):
+            batch = ipPortCombos[start:start + BATCH_SIZE]
+            data = self.post("/Client/GetCurrentGames", {
+                "TagFilter": {
+                    "Includes": [{"Data": {"gameId": ipPort}} for ipPort in batch]
+                }
+            })
+            for game in data.get("Games", []):
+                gameId = game.get("Tags", {}).get("gameId")
+                if gameId in servers:
+                    servers[gameId].append(game)
+        return servers
@@ -0,0 +1,12 @@
+# crash safe replacement of the json files the loader and its caches keep
+
+import os
+
+
+def writeFileAtomic(path, data):
+    # a crash leaves either the old or the new file, never a truncated one
+    with open(path + ".tmp", "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
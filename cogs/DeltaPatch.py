@@ -0,0 +1,125 @@
+# binary patches between two versions of a pak, as a list of "copy from the old file" and "insert new bytes" operations
+#
+# make a patch: python -m cogs.DeltaPatch OLD.pak NEW.pak OUT.patch
+
+import os
+import sys
+import struct
+import random
+import hashlib
+
+MAGIC = b"AMLDELTA"
+PATCH_VERSION = 1
+OP_COPY = b"C"
+OP_INSERT = b"I"
+OP_END = b"E"
+COPY_ARGS = struct.Struct("<QQ")
+INSERT_ARGS = struct.Struct("<Q")
+CHUNK_SIZE = 1024 * 1024
+
+# content defined chunking, so that chunks still match after data moved within the pak
+MIN_BLOCK = 2 * 1024
+MAX_BLOCK = 64 * 1024
+BOUNDARY_MASK = (1 << 13) - 1
+GEAR = [random.Random(i).getrandbits(32) for i in range(256)]
+
+
+class PatchError(Exception):
+    pass
+
+
+def readExactly(f, length):
+    data = f.read(length)
+    if len(data) != length:
+        raise PatchError("patch is truncated")
+    return data
+
+
+def applyPatch(basePath, patchPath, outPath):
+    """Writes the patched file to outPath, reading base and patch in chunks of at most CHUNK_SIZE."""
+    baseSize = os.path.getsize(basePath)
+    with open(basePath, "rb") as base, open(patchPath, "rb") as patch, open(outPath, "wb") as out:
+        if readExactly(patch, len(MAGIC)) != MAGIC or readExactly(patch, 1)[0] != PATCH_VERSION:
+            raise PatchError("not a patch file or an unsupported patch version")
+
+        while True:
+            op = readExactly(patch, 1)
+            if op == OP_END:
+                return
+            elif op == OP_COPY:
+                offset, length = COPY_ARGS.unpack(readExactly(patch, COPY_ARGS.size))
+                if offset + length > baseSize:
+                    raise PatchError("patch doesn't belong to this base file")
+                base.seek(offset)
+                while length > 0:
+                    data = readExactly(base, min(length, CHUNK_SIZE))
+                    out.write(data)
+                    length -= len(data)
+            elif op == OP_INSERT:
+                length, = INSERT_ARGS.unpack(readExactly(patch, INSERT_ARGS.size))
+                while length > 0:
+                    data = readExactly(patch, min(length, CHUNK_SIZE))
+                    out.write(data)
+                    length -= len(data)
+            else:
+                raise PatchError(f"unknown patch operation {op}")
+
+
+def iterBlocks(path):
+    """Yields (offset, data) of content defined blocks."""
+    with open(path, "rb") as f:
+        data = f.read()
+    start = 0
+    h = 0
+    i = 0
+    end = len(data)
+    while i < end:
+        h = ((h << 1) + GEAR[data[i]]) & 0xFFFFFFFF
+        i += 1
+        length = i - start
+        if (length >= MIN_BLOCK and (h & BOUNDARY_MASK) == 0) or length >= MAX_BLOCK:
+            yield start, data[start:i]
+            start = i
+            h = 0
+    if start < end:
+        yield start, data[start:end]
+
+
+def makePatch(basePath, newPath, patchPath):
+    """Writes a patch from basePath to newPath and returns its size. Meant for index maintainers, not the loader."""
+    known = {}
+    for offset, block in iterBlocks(basePath):
+        known.setdefault(hashlib.sha1(block).digest(), (offset, len(block)))
+
+    ops = []
+    for offset, block in iterBlocks(newPath):
+        match = known.get(hashlib.sha1(block).digest())
+        if match is not None:
+            # merge copies of consecutive base blocks
+            if len(ops) > 0 and ops[-1][0] == OP_COPY and ops[-1][1] + ops[-1][2] == match[0]:
+                ops[-1][2] += match[1]
+            else:
+                ops.append([OP_COPY, match[0], match[1]])
+        elif len(ops) > 0 and ops[-1][0] == OP_INSERT:
+            ops[-1][1].append(block)
+        else:
+            ops.append([OP_INSERT, [block]])
+
+    with open(patchPath, "wb") as f:
+        f.write(MAGIC + bytes([PATCH_VERSION]))
+        for op in ops:
+            if op[0] == OP_COPY:
+                f.write(OP_COPY + COPY_ARGS.pack(op[1], op[2]))
+            else:
+                data = b"".join(op[1])
+                f.write(OP_INSERT + INSERT_ARGS.pack(len(data)) + data)
+        f.write(OP_END)
+    return os.path.getsize(patchPath)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("Usage: python -m cogs.DeltaPatch OLD.pak NEW.pak OUT.patch")
+        sys.exit(1)
+    patchSize = makePatch(sys.argv[1], sys.argv[2], sys.argv[3])
+    print(f"Patch is {patchSize} bytes, {patchSize / max(1, os.path.getsize(sys.argv[2])) * 100:.1f}% of the new file")
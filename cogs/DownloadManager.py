@@ -0,0 +1,130 @@
+# parallel, resumable and verified file downloads
+
+import os
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from cogs.MetadataCache import hashFile
+from cogs.DeltaPatch import applyPatch
+from cogs.Metrics import metrics
+
+MAX_PARALLEL = 4
+MAX_ATTEMPTS = 3
+REQUEST_TIMEOUT = 30
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadManager():
+    """Downloads into a .part file next to the target, resumes it with Range requests and renames it when verified."""
+
+    def __init__(self, session, maxParallel=MAX_PARALLEL, timeout=REQUEST_TIMEOUT):
+        self.session = session
+        self.maxParallel = maxParallel
+        self.timeout = timeout
+
+    def download(self, url, targetPath, sha256=None, size=None, patch=None):
+        # a patch needs the hash to tell whether it produced the right file
+        if patch is not None and sha256 is not None:
+            try:
+                self.downloadPatched(targetPath, sha256, size, patch)
+                return
+            except Exception as e:
+                logging.warning(f"Patching {os.path.basename(targetPath)} failed ({e}), downloading it in full")
+                logging.debug(traceback.format_exc())
+
+        partPath = targetPath + ".part"
+        lastError = None
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                self.fetchPart(url, partPath, size)
+                self.verify(partPath, sha256, size)
+                os.replace(partPath, targetPath)
+                return
+            except DownloadError as e:
+                # the part file is useless, start over
+                lastError = e
+                if os.path.isfile(partPath):
+                    os.remove(partPath)
+            except Exception as e:
+                # keep the part file around to resume from it
+                lastError = e
+            logging.debug(f"Download attempt {attempt + 1} of {url} failed: {lastError}")
+        raise lastError
+
+    def downloadPatched(self, targetPath, sha256, size, patch):
+        """patch has the url, sha256 and size of the patch file and the path of the base file it applies to."""
+        patchPath = targetPath + ".patch"
+        # not the .part file, that one may hold an interrupted full download to resume
+        patchedPath = targetPath + ".patched"
+        try:
+            self.download(patch["url"], patchPath, patch.get("sha256"), patch.get("size"))
+            applyPatch(patch["base"], patchPath, patchedPath)
+            self.verify(patchedPath, sha256, size)
+            patchSize = os.path.getsize(patchPath)
+            os.replace(patchedPath, targetPath)
+            # an interrupted full download isn't needed anymore
+            if os.path.isfile(targetPath + ".part"):
+                os.remove(targetPath + ".part")
+        finally:
+            for path in (patchPath, patchPath + ".part", patchedPath):
+                if os.path.isfile(path):
+                    os.remove(path)
+
+        saved = os.path.getsize(targetPath) - patchSize
+        metrics.count("bytes_saved", saved)
+        metrics.count("bytes_written", os.path.getsize(targetPath))
+        logging.info(f"Patched {os.path.basename(targetPath)}, saved {saved / 1024 / 1024:.2f} MiB of download")
+
+    def fetchPart(self, url, partPath, size):
+        offset = os.path.getsize(partPath) if os.path.isfile(partPath) else 0
+        if size is not None and offset >= size:
+            if offset == size:
+                return
+            raise DownloadError("partial download is larger than the expected size")
+
+        # paks are already compressed, a transfer encoding would break byte ranges
+        headers = {"Accept-Encoding": "identity"}
+        if offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+            logging.debug(f"Resuming {url} at {offset} bytes")
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if r.status_code == 416 and offset > 0:
+                # nothing left to download, verification decides if the file is complete
+                return
+            r.raise_for_status()
+            mode = "ab" if offset > 0 and r.status_code == 206 else "wb"
+            with open(partPath, mode) as f:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    metrics.count("bytes_downloaded", len(chunk))
+                    metrics.count("bytes_written", len(chunk))
+
+    def verify(self, path, sha256, size):
+        if size is not None and os.path.getsize(path) != size:
+            raise DownloadError(f"expected {size} bytes but got {os.path.getsize(path)}")
+        if sha256 is not None and hashFile(path) != sha256.lower():
+            raise DownloadError("sha256 mismatch")
+
+    def downloadAll(self, jobs):
+        """jobs maps a name to (url, targetPath, sha256, size[, patch]), returns a dict of the names that failed and why."""
+        failed = {}
+        if len(jobs) == 0:
+            return failed
+
+        with ThreadPoolExecutor(max_workers=min(self.maxParallel, len(jobs))) as pool:
+            futures = {name: pool.submit(self.download, *jobs[name]) for name in jobs}
+            for name in sorted(futures):
+                try:
+                    futures[name].result()
+                    logging.debug(f"{name} download finished")
+                except Exception as e:
+                    logging.error(f"An exception occured while downloading {name}")
+                    logging.debug(traceback.format_exc())
+                    failed[name] = e
+        return failed
@@ -0,0 +1,100 @@
+# places files using hardlinks, reflinks or symlinks where the filesystem allows it, copying otherwise
+
+import os
+import shutil
+import logging
+
+from cogs.Metrics import metrics
+
+AUTO = "auto"
+HARDLINK = "hardlink"
+REFLINK = "reflink"
+SYMLINK = "symlink"
+COPY = "copy"
+STRATEGIES = (AUTO, HARDLINK, REFLINK, SYMLINK, COPY)
+
+# order in which strategies are tried, symlinks are only used when explicitly requested
+AUTO_ORDER = (HARDLINK, REFLINK, COPY)
+
+# linux ioctl to share the extents of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def reflinkFile(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+
+        # copy_file_range stays in the kernel and still shares extents on some filesystems
+        if not hasattr(os, "copy_file_range"):
+            raise OSError("reflinks are not supported on this platform")
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+
+
+class FileLinker():
+    """Places src at dst with the configured strategy, remembering what works per pair of folders."""
+
+    def __init__(self, strategy=AUTO):
+        if strategy not in STRATEGIES:
+            logging.warning(f"Unknown link strategy {strategy}, falling back to {AUTO}")
+            strategy = AUTO
+        self.strategy = strategy
+        self.working = {}
+
+    def getCandidates(self, src, dst):
+        key = (os.path.dirname(os.path.abspath(src)), os.path.dirname(os.path.abspath(dst)))
+        if key in self.working:
+            candidates = [self.working[key]]
+        elif self.strategy == AUTO:
+            candidates = list(AUTO_ORDER)
+        else:
+            candidates = [self.strategy]
+        if COPY not in candidates:
+            candidates.append(COPY)
+        return key, candidates
+
+    def place(self, strategy, src, dst):
+        if strategy == HARDLINK:
+            os.link(src, dst)
+        elif strategy == REFLINK:
+            reflinkFile(src, dst)
+        elif strategy == SYMLINK:
+            os.symlink(os.path.abspath(src), dst)
+        else:
+            shutil.copyfile(src, dst)
+            size = os.path.getsize(dst)
+            metrics.count("bytes_read", size)
+            metrics.count("bytes_written", size)
+        metrics.count(f"files_{strategy}")
+
+    def link(self, src, dst):
+        # build the new file next to the target and swap it in, so an existing dst is never half written
+        tempPath = dst + ".tmp"
+        key, candidates = self.getCandidates(src, dst)
+        for strategy in candidates:
+            if os.path.lexists(tempPath):
+                os.remove(tempPath)
+            try:
+                self.place(strategy, src, tempPath)
+            except OSError:
+                if strategy == COPY:
+                    if os.path.lexists(tempPath):
+                        os.remove(tempPath)
+                    raise
+                logging.debug(f"{strategy} is not supported from {key[0]} to {key[1]}")
+                continue
+
+            if key not in self.working:
+                logging.debug(f"Using {strategy} from {key[0]} to {key[1]}")
+                self.working[key] = strategy
+            os.replace(tempPath, dst)
+            return strategy
@@ -0,0 +1,122 @@
+# waits for files to change in a folder, with inotify on linux and polling everywhere else
+
+import os
+import time
+import select
+import struct
+import logging
+
+# seconds without further events before a burst of changes is handed out
+SETTLE_TIME = 1
+POLL_INTERVAL = 2
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB
+EVENT_HEADER = struct.Struct("iIII")
+
+# returned instead of filenames when the changes are unknown and everything has to be rescanned
+ALL_FILES = None
+
+
+class InotifyWatcher():
+    name = "inotify"
+    settleTime = SETTLE_TIME
+
+    def __init__(self, path):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"Failed to watch {path}")
+
+    def read(self, timeout):
+        """Returns the names changed within timeout seconds (None waits forever)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return ALL_FILES
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                changed.add(os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher():
+    name = "polling"
+
+    def __init__(self, path, interval=POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        # a file that is still being copied changes between two polls
+        self.settleTime = max(SETTLE_TIME, interval)
+        self.snapshot = self.takeSnapshot()
+
+    def takeSnapshot(self):
+        snapshot = {}
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        waited = 0
+        while timeout is None or waited < timeout:
+            delay = self.interval if timeout is None else min(self.interval, timeout - waited)
+            time.sleep(delay)
+            waited += delay
+
+            snapshot = self.takeSnapshot()
+            changed = {name for name in snapshot.keys() | self.snapshot.keys() if snapshot.get(name) != self.snapshot.get(name)}
+            self.snapshot = snapshot
+            if len(changed) > 0:
+                return changed
+        return set()
+
+    def close(self):
+        pass
+
+
+def createWatcher(path):
+    try:
+        return InotifyWatcher(path)
+    except Exception:
+        logging.debug("inotify isn't available, polling for changes")
+        return PollingWatcher(path)
+
+
+def waitForChanges(watcher):
+    """Blocks until something changed and returns all names changed in that burst, or ALL_FILES."""
+    changed = watcher.read(None)
+    while changed is not ALL_FILES:
+        more = watcher.read(watcher.settleTime)
+        if more is ALL_FILES:
+            return ALL_FILES
+        if len(more) == 0:
+            break
+        changed |= more
+    return changed
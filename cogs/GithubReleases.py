@@ -0,0 +1,57 @@
+# update info for mods that are released on github, read from the releases of their repository
+
+import re
+
+GITHUB_API = "https://api.github.com"
+API_HEADERS = {"Accept": "application/vnd.github+json"}
+# the most the api returns per page, a full page means there may be older releases on the next one
+RELEASES_PER_PAGE = 100
+# matches "owner/repo", "https://github.com/owner/repo" and "https://github.com/owner/repo.git"
+REPOSITORY_PATTERN = re.compile(r"^(?:https?://(?:www\.)?github\.com/)?([\w.-]+)/([\w.-]+?)(?:\.git)?/?$")
+
+
+def parseRepository(url):
+    """Returns "owner/repo" for a github repository url, or None."""
+    match = REPOSITORY_PATTERN.match(url.strip())
+    return f"{match.group(1)}/{match.group(2)}" if match is not None else None
+
+
+def getReleasesUrl(repository, apiUrl=GITHUB_API, page=1):
+    return f"{apiUrl.rstrip('/')}/repos/{repository}/releases?per_page={RELEASES_PER_PAGE}&page={page}"
+
+
+def getApiHeaders(token=None):
+    headers = dict(API_HEADERS)
+    if token:
+        headers["Authorization"] = f"token {token}"
+    return headers
+
+
+def getReleaseVersions(releases, mod_id):
+    """Returns the versions of mod_id found in the pak assets of the releases.
+
+    Assets are matched by the usual file name, PRIORITY-MODID-VERSION_P.pak. Drafts and prereleases are skipped.
+    Releases are listed newest first, so if several contain the same version the newest one is used.
+    """
+    versions = {}
+    for release in releases:
+        if release.get("draft") or release.get("prerelease"):
+            continue
+        for asset in release.get("assets", []):
+            name = asset.get("name", "")
+            if not name.endswith(".pak"):
+                continue
+            parts = name.split("_")[0].split("-")
+            if len(parts) != 3 or parts[1] != mod_id or parts[2] in versions:
+                continue
+
+            versionData = {
+                "download_url": asset["browser_download_url"],
+                "filename": name,
+                "size": asset.get("size")
+            }
+            # newer api versions report a digest like "sha256:..."
+            if (asset.get("digest") or "").startswith("sha256:"):
+                versionData["sha256"] = asset["digest"][len("sha256:"):]
+            versions[parts[2]] = versionData
+    return versions
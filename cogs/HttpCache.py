@@ -0,0 +1,81 @@
+# local cache for json responses, revalidated with ETag / Last-Modified
+
+import os
+import json
+import time
+import logging
+import threading
+
+from cogs.Metrics import metrics
+from cogs.AtomicFile import writeFileAtomic
+
+CACHE_VERSION = 1
+
+
+class HttpCache():
+    """Stores parsed json responses together with their validators."""
+
+    def __init__(self, cachePath, maxAge=0):
+        self.cachePath = cachePath
+        # seconds in which a cached response is used without asking the server
+        self.maxAge = maxAge
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.cachePath):
+            try:
+                with open(self.cachePath, "r") as f:
+                    data = json.loads(f.read())
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data["responses"]
+            except Exception:
+                logging.warning("HTTP cache is corrupt, ignoring it")
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps({"version": CACHE_VERSION, "responses": self.entries})
+            self.dirty = False
+        writeFileAtomic(self.cachePath, data)
+
+    def getJson(self, session, url, timeout, headers=None):
+        entry = self.entries.get(url)
+        if entry is not None and time.time() - entry["fetched"] < self.maxAge:
+            logging.debug(f"{url} is fresh, not revalidating")
+            return entry["body"]
+
+        requestHeaders = dict(headers) if headers is not None else {}
+        if entry is not None:
+            if entry.get("etag"):
+                requestHeaders["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                requestHeaders["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            r = session.get(url, headers=requestHeaders, timeout=timeout)
+            if r.status_code == 304 and entry is not None:
+                logging.debug(f"{url} not modified")
+                with self.lock:
+                    entry["fetched"] = time.time()
+                    self.dirty = True
+                return entry["body"]
+            r.raise_for_status()
+            metrics.count("bytes_downloaded", len(r.content))
+            body = r.json()
+        except Exception:
+            if entry is None:
+                raise
+            logging.warning(f"Failed to revalidate {url}, using the cached response")
+            return entry["body"]
+
+        with self.lock:
+            self.entries[url] = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "fetched": time.time(),
+                "body": body
+            }
+            self.dirty = True
+        return body
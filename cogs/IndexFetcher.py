@@ -0,0 +1,61 @@
+# fetches mod index files concurrently, once per distinct url
+
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from cogs.Metrics import metrics
+
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = 15
+
+
+def createSession(poolSize=MAX_WORKERS):
+    import requests
+    import requests.adapters
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class IndexFetcher():
+    """Downloads and parses index files through a bounded thread pool."""
+
+    def __init__(self, session, httpCache=None, maxWorkers=MAX_WORKERS, timeout=REQUEST_TIMEOUT, headers=None):
+        self.session = session
+        self.httpCache = httpCache
+        self.maxWorkers = maxWorkers
+        self.timeout = timeout
+        self.headers = headers
+
+    def fetch(self, url):
+        if self.httpCache is not None:
+            return self.httpCache.getJson(self.session, url, self.timeout, self.headers)
+        r = self.session.get(url, headers=self.headers, timeout=self.timeout)
+        r.raise_for_status()
+        metrics.count("bytes_downloaded", len(r.content))
+        return r.json()
+
+    def fetchAll(self, urls):
+        """Returns a dict mapping every distinct url to its parsed json, or None if fetching it failed."""
+        urls = sorted(set(urls))
+        results = {}
+        if len(urls) == 0:
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(urls))) as pool:
+            futures = {url: pool.submit(self.fetch, url) for url in urls}
+            for url in urls:
+                try:
+                    results[url] = futures[url].result()
+                except Exception:
+                    logging.error(f"An exception occured while fetching {url}")
+                    logging.debug(traceback.format_exc())
+                    results[url] = None
+
+        if self.httpCache is not None:
+            self.httpCache.save()
+        return results
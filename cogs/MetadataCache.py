@@ -0,0 +1,113 @@
+# on-disk cache for data extracted from pak files (metadata.json, content hashes)
+
+import os
+import json
+import hashlib
+import logging
+
+from cogs.Metrics import metrics
+from cogs.AtomicFile import writeFileAtomic
+
+CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# (path, size, mtime) of the files whose hash was checked in this process, shared by all caches so reloads don't hash again
+verifiedFiles = set()
+
+
+def hashFile(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+            metrics.count("bytes_read", len(chunk))
+    return sha.hexdigest()
+
+
+class MetadataCache():
+    """Caches per-pak data keyed by filename and invalidated by size, mtime and (optionally) content hash."""
+
+    def __init__(self, cachePath, verifyHash=False, rebuild=False):
+        self.cachePath = cachePath
+        self.verifyHash = verifyHash
+        self.entries = {}
+        self.dirty = False
+
+        if rebuild:
+            logging.info("Rebuilding metadata cache")
+            self.dirty = True
+        else:
+            self.load()
+
+    def load(self):
+        if not os.path.isfile(self.cachePath):
+            return
+        try:
+            with open(self.cachePath, "r") as f:
+                data = json.loads(f.read())
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data["files"]
+            else:
+                logging.debug("Metadata cache has an old format, ignoring it")
+                self.dirty = True
+        except Exception:
+            logging.warning("Metadata cache is corrupt, ignoring it")
+            self.entries = {}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        writeFileAtomic(self.cachePath, json.dumps({"version": CACHE_VERSION, "files": self.entries}))
+        self.dirty = False
+
+    def getEntry(self, path):
+        """Returns the valid entry for path, creating a fresh one if the file changed."""
+        filename = os.path.basename(path)
+        stat = os.stat(path)
+
+        entry = self.entries.get(filename)
+        if entry is not None and (entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns):
+            entry = None
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if entry is not None and self.verifyHash and not key in verifiedFiles:
+            if "sha256" not in entry or entry["sha256"] != hashFile(path):
+                entry = None
+            else:
+                verifiedFiles.add(key)
+
+        if entry is None:
+            logging.debug(f"Metadata cache miss for {filename}")
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+            if self.verifyHash:
+                entry["sha256"] = hashFile(path)
+                verifiedFiles.add(key)
+            self.entries[filename] = entry
+            self.dirty = True
+        return entry
+
+    def getCachedMetadata(self, path):
+        """Returns the cached metadata for path or None, without parsing anything."""
+        return self.getEntry(path).get("metadata")
+
+    def setMetadata(self, path, metadata):
+        self.getEntry(path)["metadata"] = metadata
+        self.dirty = True
+
+    def setHash(self, path, sha):
+        self.getEntry(path)["sha256"] = sha
+        self.dirty = True
+
+    def getHash(self, path):
+        entry = self.getEntry(path)
+        if "sha256" not in entry:
+            entry["sha256"] = hashFile(path)
+            self.dirty = True
+        return entry["sha256"]
+
+    def prune(self, filenames):
+        """Drops entries for files that no longer exist."""
+        for filename in list(self.entries.keys()):
+            if filename not in filenames:
+                del self.entries[filename]
+                self.dirty = True
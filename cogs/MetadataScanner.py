@@ -0,0 +1,83 @@
+# reads metadata.json from many paks, optionally spread over a process pool
+
+import os
+import json
+import logging
+import traceback
+
+from cogs.PakReader import readMetadata
+from cogs.Metrics import metrics
+
+# starting worker processes costs more than parsing a few paks, especially on windows where they are spawned
+MIN_PARALLEL_PAKS = 16
+
+
+def readPakMetadata(path):
+    try:
+        return readMetadata(path)
+    except Exception:
+        # fall back to the full parser for pak layouts the fast reader doesn't know
+        logging.debug(f"Fast pak reader failed on {path}, using PyPAKParser")
+
+    from PyPAKParser import PakParser
+    with open(path, "rb") as pakFile:
+        PP = PakParser(pakFile)
+        mdFile = "metadata.json"
+        md = PP.List(mdFile)
+        ppData = {}
+        if mdFile in md:
+            ppData = json.loads(PP.Unpack(mdFile).Data)
+        return ppData
+
+
+def tryReadPakMetadata(path):
+    # exceptions are returned as text so that results can always be sent back from a worker process
+    try:
+        return readPakMetadata(path), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def scanInWorker(path):
+    # the counters of a worker process are sent back with the result and added up in the loader
+    metrics.enabled = True
+    metrics.reset()
+    return tryReadPakMetadata(path), metrics.counters
+
+
+def getDefaultJobs():
+    return os.cpu_count() or 1
+
+
+def scanMetadata(paths, jobs=1):
+    """Returns a dict mapping each path to its metadata, or None if it couldn't be read."""
+    paths = sorted(paths)
+    results = {}
+    metrics.count("paks_parsed", len(paths))
+    if jobs > 1 and len(paths) >= MIN_PARALLEL_PAKS:
+        jobs = min(jobs, len(paths))
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                chunksize = max(1, len(paths) // (jobs * 4))
+                for path, (result, counters) in zip(paths, pool.map(scanInWorker, paths, chunksize=chunksize)):
+                    results[path] = result
+                    for name in counters:
+                        metrics.count(name, counters[name])
+        except Exception:
+            logging.warning("Parallel metadata scan failed, scanning serially")
+            logging.debug(traceback.format_exc())
+            results = {}
+
+    for path in paths:
+        if path not in results:
+            results[path] = tryReadPakMetadata(path)
+
+    metadata = {}
+    for path in paths:
+        data, error = results[path]
+        if error is not None:
+            logging.error(f"Failed to read the metadata of {os.path.basename(path)}")
+            logging.debug(error)
+        metadata[path] = data
+    return metadata
@@ -0,0 +1,87 @@
+# phase timings and byte counters, enabled with --profile / --metrics-json
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Metrics():
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        # span path -> {"count", "total", "max"}
+        self.spans = {}
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        # spans nest per thread, e.g. updateModInstallation/integration
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(name)
+        path = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            with self.lock:
+                if path not in self.spans:
+                    self.spans[path] = {"count": 0, "total": 0.0, "max": 0.0}
+                self.spans[path]["count"] += 1
+                self.spans[path]["total"] += duration
+                self.spans[path]["max"] = max(self.spans[path]["max"], duration)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def toDict(self):
+        with self.lock:
+            return {
+                "started": self.started,
+                "duration": time.time() - self.started,
+                "spans": {path: dict(self.spans[path]) for path in self.spans},
+                "counters": dict(self.counters)
+            }
+
+    def summary(self):
+        data = self.toDict()
+        lines = [f"Timings ({data['duration']:.2f} s total):"]
+        for path in sorted(data["spans"]):
+            span = data["spans"][path]
+            indent = "  " * path.count("/")
+            name = path.split("/")[-1]
+            calls = f" ({span['count']} calls, max {span['max'] * 1000:.1f} ms)" if span["count"] > 1 else ""
+            lines.append(f"  {indent}{name}: {span['total'] * 1000:.1f} ms{calls}")
+        if len(data["counters"]) > 0:
+            lines.append("Counters:")
+            for name in sorted(data["counters"]):
+                value = data["counters"][name]
+                if name.startswith("bytes_"):
+                    lines.append(f"  {name}: {value / 1024 / 1024:.2f} MiB")
+                else:
+                    lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+    def writeJson(self, path):
+        with open(path, "w") as f:
+            f.write(json.dumps(self.toDict(), indent=4))
+
+
+# shared by the loader and the cogs
+metrics = Metrics()
@@ -0,0 +1,231 @@
+# caching http mirror for index files and mod downloads, shared by several loaders
+#
+# a request for /https/example.com/path is answered from the cache or fetched from https://example.com/path once
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cogs.Metrics import metrics
+from cogs.AtomicFile import writeFileAtomic
+
+REQUEST_TIMEOUT = 30
+CHUNK_SIZE = 1024 * 1024
+# seconds in which a cached index file is served without asking upstream
+DEFAULT_MAX_AGE = 60
+# files that never change once published, they are never revalidated
+IMMUTABLE_SUFFIXES = (".pak", ".patch")
+
+
+def rewriteUrl(url, rewrites):
+    """Replaces the longest matching prefix from rewrites, e.g. {"https://": "http://mirror:8090/https/"}."""
+    best = None
+    for prefix in rewrites:
+        if url.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return rewrites[best] + url[len(best):] if best is not None else url
+
+
+def normalizePrefix(prefix):
+    # "https://example.com" would also allow "https://example.com.evil.org/"
+    return prefix if prefix.count("/") > 2 else prefix + "/"
+
+
+def isAllowed(url, prefixes):
+    return any(url.startswith(prefix) for prefix in prefixes)
+
+
+class MirrorCache():
+    """Files fetched from upstream, each with a json sidecar holding its validators."""
+
+    def __init__(self, cachePath, session, maxAge=DEFAULT_MAX_AGE, timeout=REQUEST_TIMEOUT):
+        self.cachePath = cachePath
+        self.session = session
+        self.maxAge = maxAge
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # one lock per url, so that concurrent requests for the same file fetch it only once
+        self.urlLocks = {}
+        self.upstreamRequests = 0
+
+        if not os.path.exists(self.cachePath):
+            os.makedirs(self.cachePath)
+
+    def getPaths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cachePath, key), os.path.join(self.cachePath, key + ".json")
+
+    def getInfo(self, url):
+        dataPath, infoPath = self.getPaths(url)
+        if not os.path.isfile(dataPath) or not os.path.isfile(infoPath):
+            return None
+        try:
+            with open(infoPath, "r") as f:
+                return json.loads(f.read())
+        except Exception:
+            return None
+
+    def isFresh(self, url, info):
+        if url.split("?")[0].endswith(IMMUTABLE_SUFFIXES):
+            return True
+        return time.time() - info["fetched"] < self.maxAge
+
+    def get(self, url):
+        """Returns (dataPath, info) for url, fetching it from upstream if needed."""
+        with self.lock:
+            urlLock = self.urlLocks.setdefault(url, threading.Lock())
+
+        with urlLock:
+            info = self.getInfo(url)
+            if info is not None and self.isFresh(url, info):
+                metrics.count("mirror_hits")
+                return self.getPaths(url)[0], info
+            try:
+                return self.fetch(url, info)
+            except Exception:
+                if info is None:
+                    raise
+                logging.warning(f"Failed to revalidate {url}, serving the cached copy")
+                logging.debug(traceback.format_exc())
+                return self.getPaths(url)[0], info
+
+    def fetch(self, url, info):
+        dataPath, infoPath = self.getPaths(url)
+        headers = {}
+        if info is not None:
+            if info.get("etag"):
+                headers["If-None-Match"] = info["etag"]
+            if info.get("last_modified"):
+                headers["If-Modified-Since"] = info["last_modified"]
+
+        with self.lock:
+            self.upstreamRequests += 1
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if r.status_code == 304 and info is not None:
+                metrics.count("mirror_revalidated")
+                info["fetched"] = time.time()
+            else:
+                r.raise_for_status()
+                metrics.count("mirror_misses")
+                sha = hashlib.sha256()
+                with open(dataPath + ".tmp", "wb") as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        sha.update(chunk)
+                        metrics.count("bytes_downloaded", len(chunk))
+                os.replace(dataPath + ".tmp", dataPath)
+                info = {
+                    "url": url,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "content_type": r.headers.get("Content-Type", "application/octet-stream"),
+                    "sha256": sha.hexdigest(),
+                    "fetched": time.time()
+                }
+
+        writeFileAtomic(infoPath, json.dumps(info))
+        return dataPath, info
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug("Mirror: " + format % args)
+
+    def do_GET(self):
+        scheme, _, rest = self.path.lstrip("/").partition("/")
+        if not scheme in ("http", "https") or rest == "":
+            self.send_error(404, "expected /<scheme>/<host>/<path>")
+            return
+
+        # only known upstreams are fetched, the mirror must not become an open proxy
+        if not isAllowed(f"{scheme}://{rest}", self.server.allowed):
+            self.send_error(403, "upstream not allowed")
+            return
+
+        try:
+            dataPath, info = self.server.cache.get(f"{scheme}://{rest}")
+        except Exception as e:
+            logging.error(f"Mirror failed to fetch {scheme}://{rest}")
+            logging.debug(traceback.format_exc())
+            self.send_error(502, str(e))
+            return
+
+        # the cached file is shared between clients, validators let the loaders' http cache skip unchanged files
+        etag = f'"{info["sha256"]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        # opened first, a revalidation may replace the cached file meanwhile
+        f = open(dataPath, "rb")
+        try:
+            self.sendFile(f, info, etag)
+        finally:
+            f.close()
+
+    def sendFile(self, f, info, etag):
+        size = os.fstat(f.fileno()).st_size
+        start = 0
+        rangeHeader = self.headers.get("Range", "")
+        if rangeHeader.startswith("bytes=") and rangeHeader.endswith("-"):
+            try:
+                start = int(rangeHeader[len("bytes="):-1])
+            except ValueError:
+                start = 0
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        self.send_response(206 if start > 0 else 200)
+        self.send_header("Content-Type", info["content_type"])
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        if start > 0:
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.end_headers()
+        f.seek(start)
+        shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+
+class MirrorServer():
+    """Serves a MirrorCache over http in a background thread, fetching only urls that start with one of the allowed prefixes."""
+
+    def __init__(self, cache, allowed, host="127.0.0.1", port=0):
+        self.cache = cache
+        self.server = ThreadingHTTPServer((host, port), MirrorHandler)
+        self.server.daemon_threads = True
+        self.server.cache = cache
+        self.server.allowed = [normalizePrefix(prefix) for prefix in allowed]
+        self.baseUrl = f"http://{host}:{self.server.server_port}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serveForever(self):
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
@@ -0,0 +1,86 @@
+# retention policy for old mod versions in the Mods folder
+
+import os
+import json
+import time
+import logging
+
+from cogs.AtomicFile import writeFileAtomic
+
+USAGE_VERSION = 1
+# last use times are only written when they are older than this
+USAGE_SAVE_INTERVAL = 60 * 60
+DEFAULT_MAX_VERSIONS = 3
+
+
+class VersionUsage():
+    """Remembers when each pak in the Mods folder was last installed."""
+
+    def __init__(self, usagePath):
+        self.usagePath = usagePath
+        self.files = {}
+        self.dirty = False
+
+        if os.path.isfile(self.usagePath):
+            try:
+                with open(self.usagePath, "r") as f:
+                    data = json.loads(f.read())
+                if data.get("version") == USAGE_VERSION:
+                    self.files = data["files"]
+            except Exception:
+                logging.warning("Version usage file is corrupt, ignoring it")
+
+    def save(self):
+        if not self.dirty:
+            return
+        writeFileAtomic(self.usagePath, json.dumps({"version": USAGE_VERSION, "files": self.files}))
+        self.dirty = False
+
+    def markUsed(self, filenames):
+        now = time.time()
+        for filename in filenames:
+            if now - self.files.get(filename, 0) > USAGE_SAVE_INTERVAL:
+                self.files[filename] = now
+                self.dirty = True
+
+    def getLastUsed(self, path):
+        # versions that were never installed count from the time they were downloaded
+        lastUsed = self.files.get(os.path.basename(path))
+        return lastUsed if lastUsed is not None else os.path.getmtime(path)
+
+    def prune(self, filenames):
+        for filename in list(self.files):
+            if not filename in filenames:
+                del self.files[filename]
+                self.dirty = True
+
+
+def planEviction(candidates, maxTotalSize=None, maxVersions=None):
+    """Picks the versions to delete, least recently used first.
+
+    candidates is a list of dicts with mod_id, version, filename, size, last_used and active,
+    active versions are never picked. Returns the picked dicts.
+    """
+    evicted = []
+    remaining = sorted(candidates, key=lambda c: c["last_used"])
+
+    if maxVersions is not None:
+        perMod = {}
+        for candidate in remaining:
+            perMod[candidate["mod_id"]] = perMod.get(candidate["mod_id"], 0) + 1
+        for candidate in remaining:
+            if perMod[candidate["mod_id"]] > maxVersions and not candidate["active"]:
+                evicted.append(candidate)
+                perMod[candidate["mod_id"]] -= 1
+        remaining = [c for c in remaining if not c in evicted]
+
+    if maxTotalSize is not None:
+        totalSize = sum(c["size"] for c in remaining)
+        for candidate in remaining:
+            if totalSize <= maxTotalSize:
+                break
+            if not candidate["active"]:
+                evicted.append(candidate)
+                totalSize -= candidate["size"]
+
+    return evicted
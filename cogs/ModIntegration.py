@@ -0,0 +1,191 @@
+# mod integration backends and a cache for their output
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+
+from cogs.MetadataCache import hashFile
+from cogs.Metrics import metrics
+from cogs.AtomicFile import writeFileAtomic
+
+INTEGRATOR_PAK = "999-AstroModIntegrator_P.pak"
+MAX_CACHED_RESULTS = 8
+# how often the last use of a cached result is written back to the index
+USAGE_SAVE_INTERVAL = 60 * 60
+
+
+def getDllPath():
+    # deal with binary loading in .exe
+    # pylint: disable=no-member
+    if hasattr(sys, "_MEIPASS"):
+        return os.path.join(sys._MEIPASS, "dlls")
+    else:
+        return os.path.abspath("dlls")
+
+
+class IntegratorBackend(ABC):
+    """Writes INTEGRATOR_PAK into modsPath, integrating the mods in it with the game paks."""
+
+    @classmethod
+    def identity(cls):
+        # part of the cache fingerprint, must be available without loading the backend
+        return cls.__name__
+
+    @abstractmethod
+    def integrate(self, modsPath, gamePaksPath):
+        pass
+
+
+class DotNetIntegrator(IntegratorBackend):
+    """Runs atenfyr's AstroModIntegrator through pythonnet."""
+
+    def __init__(self):
+        # pylint: disable=import-error
+        import clr
+
+        dllPath = getDllPath()
+        if dllPath not in sys.path:
+            sys.path.append(dllPath)
+        clr.AddReference("AstroModIntegrator")
+        from AstroModIntegrator import ModIntegrator
+        self.modIntegrator = ModIntegrator
+
+    @classmethod
+    def identity(cls):
+        stat = os.stat(os.path.join(getDllPath(), "AstroModIntegrator.dll"))
+        return f"{cls.__name__}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def integrate(self, modsPath, gamePaksPath):
+        self.modIntegrator.IntegrateMods(modsPath, gamePaksPath)
+
+
+class StubIntegrator(IntegratorBackend):
+    """Stand-in for the .NET integrator, e.g. for tests on systems without .NET."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def integrate(self, modsPath, gamePaksPath):
+        self.calls += 1
+        inputs = sorted(f for f in os.listdir(modsPath) if f != INTEGRATOR_PAK)
+        with open(os.path.join(modsPath, INTEGRATOR_PAK), "w") as f:
+            f.write(json.dumps({"inputs": inputs}))
+
+
+class IntegrationCache():
+    """Reuses integrator output when the input paks and the game paks are unchanged."""
+
+    def __init__(self, cachePath, stagingPath, backendClass, linker):
+        self.cachePath = cachePath
+        self.stagingPath = stagingPath
+        self.linker = linker
+        self.backendClass = backendClass
+        self.backend = None
+
+        if not os.path.exists(self.cachePath):
+            os.makedirs(self.cachePath)
+        self.indexPath = os.path.join(self.cachePath, "index.json")
+        self.index = {}
+        if os.path.isfile(self.indexPath):
+            try:
+                with open(self.indexPath, "r") as f:
+                    self.index = json.loads(f.read())
+            except Exception:
+                logging.warning("Integration cache index is corrupt, ignoring it")
+
+    def getBackend(self):
+        if self.backend is None:
+            self.backend = self.backendClass()
+        return self.backend
+
+    def fingerprint(self, inputHashes, gamePaksPath, backendIdentity):
+        # the game paks are large and only change with game updates, so size and mtime are enough
+        gamePaks = []
+        if os.path.isdir(gamePaksPath):
+            for f in sorted(os.listdir(gamePaksPath)):
+                if f.endswith(".pak"):
+                    stat = os.stat(os.path.join(gamePaksPath, f))
+                    gamePaks.append([f, stat.st_size, stat.st_mtime_ns])
+
+        data = json.dumps({
+            "inputs": sorted(inputHashes.items()),
+            "game_paks": gamePaks,
+            "backend": backendIdentity
+        })
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def getResult(self, inputs, inputHashes, gamePaksPath):
+        """Returns the path to the cached integrator pak, running the integrator on a miss."""
+        fingerprint = self.getFingerprint(inputHashes, gamePaksPath)
+        resultPath = os.path.join(self.cachePath, fingerprint + ".pak")
+
+        if fingerprint in self.index.get("results", {}) and os.path.isfile(resultPath):
+            logging.debug("Reusing cached mod integration")
+            metrics.count("integrations_cached")
+            result = self.index["results"][fingerprint]
+            if time.time() - result["used"] > USAGE_SAVE_INTERVAL:
+                result["used"] = time.time()
+                self.saveIndex()
+        else:
+            backend = self.getBackend()
+
+            logging.debug("Doing mod integration")
+            metrics.count("integrations_run")
+            if os.path.exists(self.stagingPath):
+                shutil.rmtree(self.stagingPath)
+            os.mkdir(self.stagingPath)
+            try:
+                for filename in inputs:
+                    self.linker.link(inputs[filename], os.path.join(self.stagingPath, filename))
+
+                backend.integrate(self.stagingPath, gamePaksPath)
+
+                os.replace(os.path.join(self.stagingPath, INTEGRATOR_PAK), resultPath)
+            finally:
+                shutil.rmtree(self.stagingPath)
+
+            if "results" not in self.index:
+                self.index["results"] = {}
+            self.index["results"][fingerprint] = {"sha256": hashFile(resultPath), "used": time.time()}
+            self.prune()
+            self.saveIndex()
+
+        return resultPath, self.index["results"][fingerprint]["sha256"]
+
+    def getFingerprint(self, inputHashes, gamePaksPath):
+        return self.fingerprint(inputHashes, gamePaksPath, self.backendClass.identity())
+
+    def pin(self, name, fingerprint):
+        """Keeps the result for fingerprint cached while name (e.g. a profile) needs it."""
+        self.index.setdefault("pinned", {})[name] = fingerprint
+        self.saveIndex()
+
+    def unpin(self, name):
+        if name in self.index.get("pinned", {}):
+            del self.index["pinned"][name]
+            self.saveIndex()
+
+    def install(self, inputs, inputHashes, gamePaksPath, targetPath, targetHash):
+        """Places the integrator pak for inputs at targetPath; targetHash returns the hash of an existing file."""
+        resultPath, resultHash = self.getResult(inputs, inputHashes, gamePaksPath)
+        if os.path.isfile(targetPath) and targetHash(targetPath) == resultHash:
+            return
+        self.linker.link(resultPath, targetPath)
+
+    def prune(self):
+        results = self.index.get("results", {})
+        pinned = set(self.index.get("pinned", {}).values())
+        unpinned = [f for f in results if not f in pinned]
+        for fingerprint in sorted(unpinned, key=lambda f: results[f]["used"])[:-MAX_CACHED_RESULTS]:
+            del results[fingerprint]
+            resultPath = os.path.join(self.cachePath, fingerprint + ".pak")
+            if os.path.isfile(resultPath):
+                os.remove(resultPath)
+
+    def saveIndex(self):
+        writeFileAtomic(self.indexPath, json.dumps(self.index))
@@ -0,0 +1,62 @@
+# brings the install Paks folder in line with the active mods by only touching files that differ
+
+import os
+import logging
+
+ADD = "add"
+REMOVE = "remove"
+REPLACE = "replace"
+
+
+class ModReconciler():
+    """Diffs the desired install folder against the current one by name, size and hash."""
+
+    def __init__(self, installPath, sourceCache, installCache, linker):
+        self.installPath = installPath
+        self.linker = linker
+        # MetadataCache instances used for (cached) content hashes
+        self.sourceCache = sourceCache
+        self.installCache = installCache
+
+    def plan(self, desired, current):
+        """desired maps install filenames to source paths, current lists the installed filenames."""
+        actions = []
+        for filename in sorted(current):
+            if filename not in desired:
+                actions.append((REMOVE, filename))
+
+        for filename in sorted(desired):
+            if filename not in current:
+                actions.append((ADD, filename))
+            elif not self.isSame(desired[filename], os.path.join(self.installPath, filename)):
+                actions.append((REPLACE, filename))
+        return actions
+
+    def isSame(self, sourcePath, installedPath):
+        # hardlinked or symlinked installs
+        if os.path.samefile(sourcePath, installedPath):
+            return True
+        if os.path.getsize(sourcePath) != os.path.getsize(installedPath):
+            return False
+        return self.sourceCache.getHash(sourcePath) == self.installCache.getHash(installedPath)
+
+    def apply(self, desired, actions):
+        for action, filename in actions:
+            logging.debug(f"Reconcile: {action} {filename}")
+            targetPath = os.path.join(self.installPath, filename)
+            if action == REMOVE:
+                os.remove(targetPath)
+            else:
+                self.linker.link(desired[filename], targetPath)
+
+    def reconcile(self, desired, current, keep=()):
+        actions = self.plan(desired, current)
+        if len(actions) > 0:
+            self.apply(desired, actions)
+            logging.info(f"Updated mod installation ({len(actions)} changes)")
+
+        # keep holds names of files managed elsewhere whose cached hashes are still needed
+        self.installCache.prune(set(desired.keys()) | set(keep))
+        self.installCache.save()
+        self.sourceCache.save()
+        return actions
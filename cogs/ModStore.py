@@ -0,0 +1,164 @@
+# content-addressed pak store that can be shared by several mod folders (e.g. multiple servers on one host)
+
+import os
+import json
+import logging
+
+from cogs.FileLinker import FileLinker
+from cogs.AtomicFile import writeFileAtomic
+
+STORE_VERSION = 1
+
+
+def fileIdentity(stat):
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+class ModStore():
+    """Keeps every distinct pak once as blobs/<sha256[:2]>/<sha256>.pak.
+
+    index.json maps mod_id and version to a blob, stores the parsed metadata per blob and
+    remembers the hash of known inodes, so hardlinked files are never hashed twice. It also lists
+    the folders that use the store, to find symlinks to blobs when collecting garbage.
+    """
+
+    def __init__(self, storePath):
+        self.storePath = storePath
+        # blobs must never be symlinks, so the configured strategy isn't used here
+        self.linker = FileLinker()
+        self.indexPath = os.path.join(self.storePath, "index.json")
+        if not os.path.exists(os.path.join(self.storePath, "blobs")):
+            os.makedirs(os.path.join(self.storePath, "blobs"))
+        self.index = self.loadIndex()
+        self.dirty = False
+
+    def loadIndex(self):
+        index = {"version": STORE_VERSION, "mods": {}, "blobs": {}, "inodes": {}, "folders": []}
+        if os.path.isfile(self.indexPath):
+            try:
+                with open(self.indexPath, "r") as f:
+                    data = json.loads(f.read())
+                if data.get("version") == STORE_VERSION:
+                    index = data
+                    index.setdefault("folders", [])
+            except Exception:
+                logging.warning("Mod store index is corrupt, rebuilding it")
+        return index
+
+    def save(self):
+        if not self.dirty:
+            return
+        # other loaders may share the store, merge with what they wrote in the meantime
+        current = self.loadIndex()
+        for mod_id in self.index["mods"]:
+            current["mods"].setdefault(mod_id, {}).update(self.index["mods"][mod_id])
+        current["blobs"].update(self.index["blobs"])
+        current["inodes"].update(self.index["inodes"])
+        current["folders"] += [folder for folder in self.index["folders"] if not folder in current["folders"]]
+        for sha in list(current["blobs"]):
+            if not os.path.isfile(self.getBlobPath(sha)):
+                del current["blobs"][sha]
+        for mod_id in current["mods"]:
+            for version in list(current["mods"][mod_id]):
+                if current["mods"][mod_id][version] not in current["blobs"]:
+                    del current["mods"][mod_id][version]
+        for identity in list(current["inodes"]):
+            if current["inodes"][identity]["sha256"] not in current["blobs"]:
+                del current["inodes"][identity]
+
+        writeFileAtomic(self.indexPath, json.dumps(current))
+        self.index = current
+        self.dirty = False
+
+    def addFolder(self, path):
+        path = os.path.abspath(path)
+        if not path in self.index["folders"]:
+            self.index["folders"].append(path)
+            self.dirty = True
+
+    def getBlobPath(self, sha):
+        return os.path.join(self.storePath, "blobs", sha[:2], sha + ".pak")
+
+    def lookupHash(self, path):
+        """Returns the hash of path if its inode is known to the store, without reading it."""
+        stat = os.stat(path)
+        known = self.index["inodes"].get(fileIdentity(stat))
+        if known is not None and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+            return known["sha256"]
+        return None
+
+    def rememberHash(self, path, sha):
+        stat = os.stat(path)
+        known = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": sha}
+        if self.index["inodes"].get(fileIdentity(stat)) != known:
+            self.index["inodes"][fileIdentity(stat)] = known
+            self.dirty = True
+
+    def getMetadata(self, sha):
+        blob = self.index["blobs"].get(sha)
+        return blob.get("metadata") if blob is not None else None
+
+    def setMetadata(self, sha, metadata):
+        self.index["blobs"].setdefault(sha, {})["metadata"] = metadata
+        self.dirty = True
+
+    def find(self, mod_id, version):
+        """Returns the blob path for a mod version or None."""
+        sha = self.index["mods"].get(mod_id, {}).get(version)
+        if sha is not None and os.path.isfile(self.getBlobPath(sha)):
+            return self.getBlobPath(sha)
+        return None
+
+    def addFile(self, path, sha, mod_id, version):
+        """Stores path as a blob and links path to it, returns True if path was replaced."""
+        blobPath = self.getBlobPath(sha)
+        replaced = False
+        if not os.path.isfile(blobPath):
+            if not os.path.exists(os.path.dirname(blobPath)):
+                os.makedirs(os.path.dirname(blobPath))
+            self.linker.link(path, blobPath)
+            self.rememberHash(blobPath, sha)
+        elif not os.path.samefile(path, blobPath):
+            # an identical copy, share the blob instead
+            self.linker.link(blobPath, path)
+            replaced = True
+
+        blob = self.index["blobs"].setdefault(sha, {})
+        if blob.get("size") != os.path.getsize(blobPath):
+            blob["size"] = os.path.getsize(blobPath)
+            self.dirty = True
+        if self.index["mods"].get(mod_id, {}).get(version) != sha:
+            self.index["mods"].setdefault(mod_id, {})[version] = sha
+            self.dirty = True
+        self.rememberHash(path, sha)
+        return replaced
+
+    def collectGarbage(self, dryRun=False):
+        """Removes the blobs no mod folder links to anymore, returns their number and size."""
+        # hardlinked blobs have more than one link, symlinks are looked for in the folders using the store
+        symlinked = set()
+        for folder in self.index["folders"]:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if os.path.islink(path):
+                    symlinked.add(os.path.realpath(path))
+
+        removed = 0
+        freed = 0
+        for sha in list(self.index["blobs"]):
+            blobPath = self.getBlobPath(sha)
+            if not os.path.isfile(blobPath):
+                continue
+            stat = os.stat(blobPath)
+            if stat.st_nlink > 1 or os.path.realpath(blobPath) in symlinked:
+                continue
+            logging.info(f"{'Would remove' if dryRun else 'Removing'} unused blob {sha[:12]} from the mod store ({stat.st_size / 1024 / 1024:.2f} MiB)")
+            removed += 1
+            freed += stat.st_size
+            if not dryRun:
+                os.remove(blobPath)
+                del self.index["blobs"][sha]
+                self.dirty = True
+        return removed, freed
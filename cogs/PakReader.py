@@ -0,0 +1,214 @@
+# minimal UE4 pak reader that only touches the footer, the index and the entries it is asked for
+
+import mmap
+import json
+import zlib
+import struct
+
+from cogs.Metrics import metrics
+
+PAK_MAGIC = 0x5A6F12E1
+# distance of the magic from the end of the file for the different footer layouts
+FOOTER_OFFSETS = (
+    (44, lambda v: v < 8),     # up to PakFile_Version_EncryptionKeyGuid
+    (172, lambda v: v == 8),   # FNameBasedCompressionMethod with 4 compression names (4.22)
+    (204, lambda v: v == 8),   # FNameBasedCompressionMethod with 5 compression names (4.23+)
+    (205, lambda v: v == 9)    # FrozenIndex adds a flag before the compression names
+)
+MAX_SUPPORTED_VERSION = 9
+VERSION_NO_TIMESTAMPS = 2
+VERSION_COMPRESSION_ENCRYPTION = 3
+VERSION_RELATIVE_CHUNK_OFFSETS = 5
+VERSION_FNAME_COMPRESSION = 8
+
+LEGACY_COMPRESSION_ZLIB = 0x01
+COMPRESSION_NAME_LENGTH = 32
+
+
+class PakReaderError(Exception):
+    pass
+
+
+class PakEntry():
+    def __init__(self, name, offset, size, uncompressedSize, compression, blocks, encrypted, headerSize):
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.uncompressedSize = uncompressedSize
+        # 0 for uncompressed, otherwise the legacy flags or the 1-based compression name index
+        self.compression = compression
+        self.blocks = blocks
+        self.encrypted = encrypted
+        self.headerSize = headerSize
+
+
+class PakReader():
+    """Reads the footer on open and the index lazily, payloads are only read by read()."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise PakReaderError("empty file")
+
+        # name -> position of the entry in the index, entries are only parsed when asked for
+        self.entryPositions = {}
+        self.entries = {}
+        self.indexPosition = None
+        self.remainingEntries = 0
+        try:
+            self.readFooter()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def readFooter(self):
+        size = len(self.data)
+        for footerOffset, versionCheck in FOOTER_OFFSETS:
+            position = size - footerOffset
+            if position < 0:
+                continue
+            magic, version, indexOffset, indexSize = struct.unpack_from("<IiQQ", self.data, position)
+            if magic == PAK_MAGIC and versionCheck(version):
+                break
+        else:
+            raise PakReaderError("no supported pak footer found")
+
+        if version > MAX_SUPPORTED_VERSION:
+            raise PakReaderError(f"unsupported pak version {version}")
+        if indexOffset + indexSize > size:
+            raise PakReaderError("index is outside of the file")
+
+        # bEncryptedIndex sits directly before the magic from version 4 (IndexEncryption) on
+        if version >= 4 and self.data[size - footerOffset - 1] != 0:
+            raise PakReaderError("encrypted index")
+
+        self.version = version
+        self.compressionNames = []
+        if version >= VERSION_FNAME_COMPRESSION:
+            namesPosition = size - footerOffset + 44 + (1 if version == 9 else 0)
+            if version == 9 and self.data[namesPosition - 1] != 0:
+                raise PakReaderError("frozen index")
+            while namesPosition + COMPRESSION_NAME_LENGTH <= size:
+                name = self.data[namesPosition:namesPosition + COMPRESSION_NAME_LENGTH].split(b"\x00")[0]
+                self.compressionNames.append(name.decode("ascii", "replace"))
+                namesPosition += COMPRESSION_NAME_LENGTH
+
+        self.mountPoint, position = self.readString(indexOffset)
+        self.remainingEntries, = struct.unpack_from("<i", self.data, position)
+        self.indexPosition = position + 4
+
+    def readString(self, position):
+        length, = struct.unpack_from("<i", self.data, position)
+        position += 4
+        if length >= 0:
+            raw = self.data[position:position + length]
+            return raw.rstrip(b"\x00").decode("iso-8859-1"), position + length
+        raw = self.data[position:position - length * 2]
+        return raw.decode("utf-16-le").rstrip("\x00"), position - length * 2
+
+    def readEntry(self, position, name):
+        start = position
+        offset, size, uncompressedSize, compression = struct.unpack_from("<qqqI", self.data, position)
+        position += 28
+        if self.version < VERSION_NO_TIMESTAMPS:
+            position += 8
+        position += 20  # sha1
+
+        blocks = []
+        encrypted = False
+        if self.version >= VERSION_COMPRESSION_ENCRYPTION:
+            if compression != 0:
+                blockCount, = struct.unpack_from("<i", self.data, position)
+                position += 4
+                for i in range(blockCount):
+                    blocks.append(struct.unpack_from("<qq", self.data, position + i * 16))
+                position += blockCount * 16
+            encrypted = self.data[position] & 0x01 != 0
+            position += 5  # flags, compression block size
+
+        # the entry header is repeated in front of the payload
+        return PakEntry(name, offset, size, uncompressedSize, compression, blocks, encrypted, position - start), position
+
+    def scanIndex(self, target=None):
+        """Records entry positions until target is found (or the index ends) without parsing the entries."""
+        data = self.data
+        position = self.indexPosition
+        start = position
+        fixedSize = 48 + (8 if self.version < VERSION_NO_TIMESTAMPS else 0)
+        hasBlocks = self.version >= VERSION_COMPRESSION_ENCRYPTION
+        found = False
+        while self.remainingEntries > 0 and not found:
+            name, position = self.readString(position)
+            self.entryPositions[name] = position
+            found = name == target
+
+            compression, = struct.unpack_from("<I", data, position + 24)
+            position += fixedSize
+            if hasBlocks:
+                if compression != 0:
+                    blockCount, = struct.unpack_from("<i", data, position)
+                    position += 4 + blockCount * 16
+                position += 5
+            self.remainingEntries -= 1
+        self.indexPosition = position
+        metrics.count("bytes_read", position - start)
+
+    def find(self, name):
+        """Returns the entry for name, scanning the index only up to it."""
+        if name not in self.entryPositions:
+            self.scanIndex(name)
+        if name not in self.entryPositions:
+            return None
+        if name not in self.entries:
+            self.entries[name] = self.readEntry(self.entryPositions[name], name)[0]
+        return self.entries[name]
+
+    def list(self):
+        """Lists all entry names without reading any payload."""
+        self.scanIndex()
+        return list(self.entryPositions.keys())
+
+    def isZlib(self, compression):
+        if self.version >= VERSION_FNAME_COMPRESSION:
+            return 0 < compression <= len(self.compressionNames) and self.compressionNames[compression - 1].lower() == "zlib"
+        return compression & LEGACY_COMPRESSION_ZLIB != 0
+
+    def read(self, name):
+        entry = self.find(name)
+        if entry is None:
+            raise KeyError(name)
+        if entry.encrypted:
+            raise PakReaderError(f"{name} is encrypted")
+        metrics.count("bytes_read", entry.size)
+
+        if entry.compression == 0:
+            start = entry.offset + entry.headerSize
+            return self.data[start:start + entry.size]
+        if self.version < VERSION_COMPRESSION_ENCRYPTION or not self.isZlib(entry.compression):
+            raise PakReaderError(f"{name} uses an unsupported compression method")
+
+        blockBase = entry.offset if self.version >= VERSION_RELATIVE_CHUNK_OFFSETS else 0
+        chunks = []
+        for blockStart, blockEnd in entry.blocks:
+            chunks.append(zlib.decompress(self.data[blockBase + blockStart:blockBase + blockEnd]))
+        return b"".join(chunks)
+
+
+def readMetadata(path, metadataFile="metadata.json"):
+    with PakReader(path) as reader:
+        if reader.find(metadataFile) is None:
+            return {}
+        return json.loads(reader.read(metadataFile))
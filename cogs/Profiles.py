@@ -0,0 +1,45 @@
+# named sets of active mods and their versions, stored next to modconfig.json
+
+import os
+import json
+import logging
+
+from cogs.AtomicFile import writeFileAtomic
+
+PROFILES_VERSION = 1
+
+
+class ProfileStore():
+    def __init__(self, profilesPath):
+        self.profilesPath = profilesPath
+        self.profiles = {}
+
+        if os.path.isfile(self.profilesPath):
+            try:
+                with open(self.profilesPath, "r") as f:
+                    data = json.loads(f.read())
+                if data.get("version") == PROFILES_VERSION:
+                    self.profiles = data["profiles"]
+            except Exception:
+                logging.warning("profiles.json is corrupt, ignoring it")
+
+    def save(self):
+        writeFileAtomic(self.profilesPath, json.dumps({"version": PROFILES_VERSION, "profiles": self.profiles}, indent=4))
+
+    def names(self):
+        return sorted(self.profiles)
+
+    def get(self, name):
+        return self.profiles.get(name)
+
+    def set(self, name, mods):
+        """mods maps mod_id to {"installed", "version"}."""
+        self.profiles[name] = {"mods": mods}
+        self.save()
+
+    def delete(self, name):
+        if not name in self.profiles:
+            return False
+        del self.profiles[name]
+        self.save()
+        return True
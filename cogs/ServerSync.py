@@ -0,0 +1,83 @@
+# mod manifests published by servers, so that clients can install exactly the mods a server uses
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+
+from cogs.AtomicFile import writeFileAtomic
+
+MANIFEST_VERSION = 1
+SYNC_STATE_VERSION = 1
+# PRIORITY-MODID-VERSION_P.pak, without any path separators
+FILENAME_PATTERN = re.compile(r"([0-9]+)-([^-_/\\:\s]+)-([^-_/\\:\s]+)_P\.pak")
+
+
+def buildManifest(mods, selectedVersions, downloadPath, getHash, baseUrl=None):
+    """Lists the installed serverclient mods with the version, hash and download url clients need.
+
+    selectedVersions maps mod_id to the version in use, getHash returns the sha256 of a file.
+    """
+    entries = {}
+    for mod_id in mods:
+        if not mods[mod_id]["installed"] or mods[mod_id]["sync"] != "serverclient":
+            continue
+        version = selectedVersions[mod_id]
+        versionData = mods[mod_id]["versions"][version]
+        path = os.path.join(downloadPath, versionData["filename"])
+        downloadUrl = versionData.get("download_url")
+        if downloadUrl is None and baseUrl is not None:
+            downloadUrl = baseUrl.rstrip("/") + "/" + versionData["filename"]
+
+        entries[mod_id] = {
+            "version": version,
+            "filename": versionData["filename"],
+            "sha256": getHash(path),
+            "size": os.path.getsize(path),
+            "download_url": downloadUrl
+        }
+    return {"version": MANIFEST_VERSION, "mods": entries}
+
+
+def checkManifestEntry(mod_id, entry):
+    """Returns why a manifest entry can't be used, or None. The file name is used as a local path, so it must be a bare pak name."""
+    if not isinstance(entry, dict):
+        return "not an object"
+    if not isinstance(entry.get("version"), str) or not isinstance(entry.get("filename"), str):
+        return "version or filename missing"
+    match = FILENAME_PATTERN.fullmatch(entry["filename"])
+    if match is None or match.group(2) != mod_id or match.group(3) != entry["version"]:
+        return f"invalid file name {entry['filename']!r}"
+    if entry.get("download_url") is not None and not isinstance(entry["download_url"], str):
+        return "invalid download url"
+    return None
+
+
+def getManifestHash(manifest):
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SyncState():
+    """Remembers the hash of the last manifest that was applied completely for each server."""
+
+    def __init__(self, statePath):
+        self.statePath = statePath
+        self.servers = {}
+
+        if os.path.isfile(self.statePath):
+            try:
+                with open(self.statePath, "r") as f:
+                    data = json.loads(f.read())
+                if data.get("version") == SYNC_STATE_VERSION:
+                    self.servers = data["servers"]
+            except Exception:
+                logging.warning("Server sync state is corrupt, ignoring it")
+
+    def getAppliedHash(self, server):
+        return self.servers.get(server, {}).get("manifest_sha256")
+
+    def setAppliedHash(self, server, manifestHash):
+        self.servers[server] = {"manifest_sha256": manifestHash, "applied": time.time()}
+        writeFileAtomic(self.statePath, json.dumps({"version": SYNC_STATE_VERSION, "servers": self.servers}))
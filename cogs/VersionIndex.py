@@ -0,0 +1,78 @@
+# sorted versions per mod, kept up to date as versions are added so that nothing needs re-sorting
+
+import bisect
+import logging
+
+# version of mods without version info
+NO_VERSION = "---"
+
+
+def parseVersion(version):
+    try:
+        return tuple(map(int, version.split(".")))
+    except ValueError:
+        return None
+
+
+class VersionList():
+    """Versions of one mod in ascending order.
+
+    Versions are compared numerically (1.0.10 > 1.0.9). As soon as one of them isn't numeric
+    the whole list is sorted alphabetically instead, which is reported once per mod.
+    """
+
+    def __init__(self, mod_id):
+        self.mod_id = mod_id
+        self.versions = []
+        self.keys = []
+        self.malformed = set()
+        self.warned = False
+
+    def __contains__(self, version):
+        return version in self.versions
+
+    def __len__(self):
+        return len(self.versions)
+
+    def getKey(self, version):
+        return version if len(self.malformed) > 0 else parseVersion(version)
+
+    def resort(self):
+        self.versions.sort(key=self.getKey)
+        self.keys = [self.getKey(v) for v in self.versions]
+
+    def add(self, version):
+        if version in self.versions:
+            return
+
+        if parseVersion(version) is None:
+            if version != NO_VERSION and not self.warned:
+                logging.warning(f"{self.mod_id} has incorrect version numbering ({version}), sorting its versions alphabetically")
+                self.warned = True
+            self.malformed.add(version)
+            if len(self.malformed) == 1:
+                self.versions.append(version)
+                self.resort()
+                return
+
+        key = self.getKey(version)
+        index = bisect.bisect(self.keys, key)
+        self.keys.insert(index, key)
+        self.versions.insert(index, version)
+
+    def remove(self, version):
+        if not version in self.versions:
+            return
+        index = self.versions.index(version)
+        del self.versions[index]
+        del self.keys[index]
+        if version in self.malformed:
+            self.malformed.remove(version)
+            if len(self.malformed) == 0:
+                self.resort()
+
+    def latest(self):
+        return self.versions[-1]
+
+    def ordered(self):
+        return self.versions